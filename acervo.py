@@ -0,0 +1,278 @@
+import glob
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+import starlight_output_analysis as sl_analysis
+
+# Acervo colunar dos resultados: header, tabela de populações e espectro sintético de todos os
+# .out, em Parquet, para análises sobre todos os alvos sem reler os .out. Uma tabela por tipo de
+# dado, particionada (hive) por run e configuração:
+#
+#   <ACERVO_DIR>/header/run=<run>/config=<config>/parte.parquet     uma linha por alvo
+#   <ACERVO_DIR>/populacao/run=<run>/config=<config>/parte.parquet  uma linha por componente
+#   <ACERVO_DIR>/espectro/run=<run>/config=<config>/parte.parquet   uma linha por pixel
+#
+# Os alvos são gravados em ordem, em row groups de ACERVO_LOTE alvos: filtros por Target (e
+# pelas colunas numéricas) descartam row groups inteiros pelas estatísticas do Parquet.
+
+TABELAS = ("header", "populacao", "espectro")
+CONFIG_PADRAO = "padrao"  # Partição config de runs e mc, que não têm configurações
+TEMPORARIO = "_parte.parquet.tmp"  # Prefixo "_": a descoberta do pyarrow.dataset o ignora
+
+COLUNAS_HEADER = ("chi2", "adev", "av", "v0", "vd", "n0", "nl", "nclip")
+COLUNAS_INTEIRAS = ("n0", "nl", "nclip")
+COLUNAS_MEDIAS = (
+    "mean_log_age_light",
+    "mean_age_light_gyr",
+    "mean_Z_light",
+    "mean_log_age_mass",
+    "mean_age_mass_gyr",
+    "mean_Z_mass",
+)
+
+
+def _ler_out(out_path, espectro=True):
+    """
+    Lê um .out (em processo separado) e separa as colunas das três tabelas.
+
+    Returns:
+        tuple: ((alvo, header, população, espectro), None) ou (None, mensagem de erro)
+    """
+    try:
+        saida = sl_analysis.StarlightOutput(out_path)
+        props = saida.calculate_mean_properties() or {}
+        header = {k: getattr(saida, k) for k in COLUNAS_HEADER + ("base",)}
+        for k in COLUNAS_MEDIAS:
+            header[k] = props.get(k, np.nan)
+        alvo = os.path.basename(out_path).replace(".out", "")
+        return (alvo, header, saida.population, saida.spectrum if espectro else None), None
+    except Exception as e:
+        return None, f"{os.path.basename(out_path)}: {e}"
+
+
+def _ler_out_com_espectro(out_path):
+    return _ler_out(out_path, True)
+
+
+def _ler_out_sem_espectro(out_path):
+    return _ler_out(out_path, False)
+
+
+def _montar_tabelas(lidos):
+    """
+    Junta os .out de um lote em uma tabela pyarrow por tipo de dado.
+    """
+    import pyarrow as pa
+
+    # Tipos fixos: o schema do primeiro lote vale para o arquivo todo
+    alvos = pa.array([alvo for alvo, *_ in lidos], type=pa.string())
+    header = {"Target": alvos}
+    for k in COLUNAS_HEADER + ("base",) + COLUNAS_MEDIAS:
+        valores = [h[k] for _, h, _, _ in lidos]
+        if k in COLUNAS_INTEIRAS:
+            # NaN (campo ilegível) vira nulo
+            valores = [None if v is None or v != v else int(v) for v in valores]
+            header[k] = pa.array(valores, type=pa.int64())
+        elif k == "base":
+            header[k] = pa.array(valores, type=pa.string())
+        else:
+            header[k] = pa.array(valores, type=pa.float64())
+    tabelas = {"header": pa.table(header)}
+
+    # Target das tabelas longas: take sobre os nomes do lote em vez de milhões de strings Python
+    # (o Parquet o grava com dicionário de qualquer forma, com estatísticas por row group)
+    for nome, indice in (("populacao", 2), ("espectro", 3)):
+        blocos = [l[indice] for l in lidos]
+        if blocos[0] is None:
+            continue
+        n = [len(next(iter(b.values()))) for b in blocos]
+        posicoes = np.repeat(np.arange(len(blocos), dtype=np.int32), n)
+        colunas = {"Target": alvos.take(posicoes)}
+        for k in blocos[0]:
+            colunas[k] = np.concatenate([b[k] for b in blocos])
+        tabelas[nome] = pa.table(colunas)
+    return tabelas
+
+
+def diretorio_particao(tabela, run, configuracao=CONFIG_PADRAO, destino=None):
+    destino = destino or config.ACERVO_DIR
+    return os.path.join(destino, tabela, f"run={run}", f"config={configuracao}")
+
+
+def exportar(
+    out_paths, run, configuracao=CONFIG_PADRAO, n_workers=1, espectro=None, destino=None
+):
+    """
+    Exporta os .out para o acervo, substituindo a partição run/configuracao de cada tabela.
+    Os arquivos são gravados como _parte.parquet.tmp (ignorado pelo pyarrow.dataset) e
+    renomeados por cima de parte.parquet no fim: uma exportação interrompida não deixa uma
+    partição pela metade e uma leitura concorrente vê a partição antiga ou a nova.
+
+    Args:
+        out_paths [list]: Arquivos .out
+        run [str]: Partição run (ex.: "runs", "montecarlo", "sweep-<nome>")
+        configuracao [str]: Partição config (rótulo da configuração de um sweep)
+        n_workers [int]: Processos de leitura
+        espectro [bool]: Exporta também o espectro sintético (padrão: config.ACERVO_ESPECTRO)
+        destino [str]: Diretório do acervo (padrão: config.ACERVO_DIR)
+
+    Returns:
+        int: Número de .out exportados (None se o pyarrow não está instalado)
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("  [AVISO] pyarrow não instalado: acervo de resultados não exportado.")
+        return None
+
+    if espectro is None:
+        espectro = config.ACERVO_ESPECTRO
+    out_paths = sorted(out_paths, key=os.path.basename)
+    ler = _ler_out_com_espectro if espectro else _ler_out_sem_espectro
+    paths = {t: diretorio_particao(t, run, configuracao, destino) for t in TABELAS}
+    lotes = [
+        out_paths[i : i + config.ACERVO_LOTE]
+        for i in range(0, len(out_paths), config.ACERVO_LOTE)
+    ]
+    escritores = {}
+    exportados = 0
+    executor = ProcessPoolExecutor(max_workers=n_workers) if n_workers > 1 else None
+
+    def ler_lote(lote):
+        if executor is None:
+            return (ler(p) for p in lote)
+        return executor.map(ler, lote, chunksize=max(1, len(lote) // (n_workers * 4)))
+
+    try:
+        proximo = ler_lote(lotes[0]) if lotes else None
+        for k in range(len(lotes)):
+            resultados = list(proximo)
+            # Os processos já leem o lote seguinte enquanto este é gravado
+            if k + 1 < len(lotes):
+                proximo = ler_lote(lotes[k + 1])
+
+            lidos = []
+            for lido, erro in resultados:
+                if erro is not None:
+                    print(f"  [ERRO] Leitura: {erro}")
+                else:
+                    lidos.append(lido)
+            if not lidos:
+                continue
+
+            for nome, tabela in _montar_tabelas(lidos).items():
+                if nome not in escritores:
+                    os.makedirs(paths[nome], exist_ok=True)
+                    escritores[nome] = pq.ParquetWriter(
+                        os.path.join(paths[nome], TEMPORARIO),
+                        tabela.schema,
+                        compression=config.ACERVO_COMPRESSAO,
+                    )
+                escritores[nome].write_table(tabela)
+            exportados += len(lidos)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        for escritor in escritores.values():
+            escritor.close()
+
+    if out_paths and not escritores:
+        # Nenhum .out legível: mantém a partição anterior em vez de apagá-la
+        print(f"  [AVISO] Acervo: nenhum .out legível; run={run}/config={configuracao} mantida.")
+        return 0
+
+    # Troca cada partição pelo arquivo novo com um único rename; tabelas que não foram gravadas
+    # (sem espectro, ou nenhum .out) têm a partição antiga removida
+    for nome in TABELAS:
+        if nome in escritores:
+            os.replace(
+                os.path.join(paths[nome], TEMPORARIO),
+                os.path.join(paths[nome], "parte.parquet"),
+            )
+        elif os.path.isdir(paths[nome]):
+            shutil.rmtree(paths[nome])
+            if not os.listdir(os.path.dirname(paths[nome])):
+                os.rmdir(os.path.dirname(paths[nome]))
+
+    print(f"  > Acervo: {exportados} .out exportados em run={run}/config={configuracao}.")
+    return exportados
+
+
+def fontes():
+    """
+    Diretórios de saída existentes no projeto e suas partições.
+
+    Returns:
+        list: Tuplas (run, config, diretório dos .out)
+    """
+    import montecarlo
+    import sweep
+
+    encontradas = [
+        ("runs", CONFIG_PADRAO, os.path.join(config.PIPELINE_DIR, "outputs")),
+        ("montecarlo", CONFIG_PADRAO, os.path.join(montecarlo.MC_DIR, "outputs")),
+    ]
+    for cfg_outputs in sorted(glob.glob(os.path.join(sweep.SWEEP_DIR, "*", "*", "outputs"))):
+        cfg_dir = os.path.dirname(cfg_outputs)
+        nome = os.path.basename(os.path.dirname(cfg_dir))
+        encontradas.append((f"sweep-{nome}", os.path.basename(cfg_dir), cfg_outputs))
+    return [f for f in encontradas if glob.glob(os.path.join(f[2], "*.out"))]
+
+
+def exportar_existentes(runs=None, n_workers=1, espectro=None, destino=None):
+    """
+    Exporta para o acervo os .out já existentes (runs, montecarlo e cada configuração de
+    cada sweep), sem rodar nada.
+
+    Args:
+        runs [list]: Só estas partições run (None = todas)
+    """
+    total = 0
+    for run, configuracao, out_dir in fontes():
+        if runs and run not in runs:
+            continue
+        out_paths = glob.glob(os.path.join(out_dir, "*.out"))
+        n = exportar(out_paths, run, configuracao, n_workers, espectro, destino)
+        if n is None:
+            return None
+        total += n
+    return total
+
+
+def carregar(tabela, colunas=None, filtros=None, destino=None):
+    """
+    Lê uma tabela do acervo lendo só o necessário: só as colunas pedidas são decodificadas,
+    filtros em run/config descartam partições inteiras pelo caminho e os demais descartam
+    row groups pelas estatísticas antes de ler os dados.
+
+    Args:
+        tabela [str]: "header", "populacao" ou "espectro"
+        colunas [list]: Colunas a ler, incluindo run/config se desejado (None = todas)
+        filtros [list | pyarrow.compute.Expression]: Filtros como os de pandas.read_parquet,
+            ex.: [("run", "==", "runs"), ("Target", "in", ["NGC104", "NGC362"])]
+        destino [str]: Diretório do acervo (padrão: config.ACERVO_DIR)
+
+    Returns:
+        pandas.DataFrame: Linhas que passam nos filtros
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+
+    if tabela not in TABELAS:
+        raise ValueError(f"Tabela desconhecida: {tabela} (use {', '.join(TABELAS)})")
+    path = os.path.join(destino or config.ACERVO_DIR, tabela)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"Tabela não exportada: {path}")
+
+    particoes = ds.partitioning(
+        pa.schema([("run", pa.string()), ("config", pa.string())]), flavor="hive"
+    )
+    dataset = ds.dataset(path, format="parquet", partitioning=particoes)
+    if filtros is not None and not isinstance(filtros, ds.Expression):
+        filtros = pq.filters_to_expression(filtros)
+    return dataset.to_table(columns=colunas, filter=filtros).to_pandas()
@@ -0,0 +1,240 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import config
+import runs
+import scheduler
+import spec_io
+
+# Benchmark da pipeline de ajustes com o mock_starlight.py no lugar do executável real.
+# Para cada tamanho, monta um projeto temporário (N entradas .in, uma base sintética, máscara e
+# configuração) e mede:
+#   - overhead da pipeline: impressões digitais, previsão de custos, grids, colheita e summary
+#   - eficiência do scheduler: trabalho total / (workers x makespan)
+#   - vazão da colheita: .out lidos por segundo (serial e em paralelo)
+
+MOCK_EXE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_starlight.py")
+TAMANHOS = (10, 1000, 10000)
+
+# Janela curta: o que se mede é a pipeline, não o tamanho dos arquivos
+PARAMS_BENCHMARK = {
+    "olsyn_ini": 4000,
+    "olsyn_fin": 6000,
+    "lllow_SN": 4900,
+    "llup_SN": 5100,
+}
+N_BASE = 12
+
+
+def montar_projeto(raiz, n_alvos, rng):
+    """
+    Cria um projeto mínimo em raiz. As entradas são hard links de alguns espectros distintos
+    (com números de pixels válidos diferentes), então 10 mil alvos não ocupam 10 mil arquivos.
+
+    Returns:
+        list: Nomes dos alvos
+    """
+    s = {**config.STARLIGHT_PARAMS, **PARAMS_BENCHMARK}
+    inputs_dir = os.path.join(raiz, "inputs")
+    base_dir = os.path.join(raiz, s["base_dir"])
+    os.makedirs(inputs_dir)
+    os.makedirs(base_dir)
+
+    l_ambda = np.arange(3800.0, 6200.0 + 0.5, 1.0)
+    modelos = []
+    for m in range(8):
+        fluxo = 1 + 0.1 * np.sin(l_ambda / (40 + 5 * m)) + rng.normal(0, 0.01, len(l_ambda))
+        erro = np.full(len(l_ambda), 0.02)
+        flag = np.zeros(len(l_ambda))
+        flag[rng.random(len(l_ambda)) < 0.1 * m] = 2  # de 0% a 70% de pixels sinalizados
+        path = os.path.join(inputs_dir, f"_modelo{m}.in")
+        spec_io.escrever_in(path, l_ambda, fluxo, erro, flag)
+        modelos.append(path)
+
+    alvos = [f"ALVO{i:05d}" for i in range(n_alvos)]
+    for i, alvo in enumerate(alvos):
+        os.link(modelos[i % len(modelos)], os.path.join(inputs_dir, f"{alvo}.in"))
+
+    linhas = [f"{N_BASE}            [N_base]\n"]
+    for j in range(N_BASE):
+        spec = f"ssp_{j:02d}.spec"
+        idade = 10 ** (8 + 2 * j / N_BASE)
+        z = (0.004, 0.008, 0.019)[j % 3]
+        spec_io.escrever_spec(os.path.join(base_dir, spec), l_ambda, np.ones(len(l_ambda)))
+        linhas.append(f"{spec}     {idade:.5e}    {z}     ssp_{j:02d}  1.0     0     0.0000\n")
+    with open(os.path.join(raiz, s["base"]), "w") as f:
+        f.writelines(linhas)
+    for arquivo in (s["mask"], s["template_config"]):
+        with open(os.path.join(raiz, arquivo), "w") as f:
+            f.write("# benchmark\n")
+    return alvos
+
+
+@contextlib.contextmanager
+def projeto_temporario(n_alvos, tempo_ajuste, carga):
+    """
+    Aponta config para um projeto temporário com o mock, restaurando tudo no fim.
+    """
+    raiz = tempfile.mkdtemp(prefix="bench_starlight_")
+    nomes = ("PIPELINE_DIR", "INPUTS_DIR", "STARLIGHT_EXE", "STARLIGHT_PARAMS", "USE_BASE_CACHE")
+    antigos = {k: getattr(config, k) for k in nomes}
+    ambiente = {k: os.environ.get(k) for k in ("MOCK_STARLIGHT_AJUSTE", "MOCK_STARLIGHT_CARGA")}
+    try:
+        alvos = montar_projeto(raiz, n_alvos, np.random.default_rng(0))
+        config.PIPELINE_DIR = raiz
+        config.INPUTS_DIR = os.path.join(raiz, "inputs")
+        config.STARLIGHT_EXE = MOCK_EXE
+        config.STARLIGHT_PARAMS = {**antigos["STARLIGHT_PARAMS"], **PARAMS_BENCHMARK}
+        config.USE_BASE_CACHE = False
+        os.environ["MOCK_STARLIGHT_AJUSTE"] = str(tempo_ajuste)
+        os.environ["MOCK_STARLIGHT_CARGA"] = str(carga)
+        yield raiz, alvos
+    finally:
+        for k, v in antigos.items():
+            setattr(config, k, v)
+        for k, v in ambiente.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        shutil.rmtree(raiz, ignore_errors=True)
+
+
+def medir(n_alvos, n_workers, tempo_ajuste=0.0, carga=0.0):
+    """
+    Roda a pipeline completa (impressões, grids, STARLIGHT, colheita, summary) sobre n_alvos.
+
+    Returns:
+        dict: Tempos de cada fase [s], eficiência do scheduler e vazão da colheita
+    """
+    with projeto_temporario(n_alvos, tempo_ajuste, carga) as (raiz, alvos):
+        s = config.STARLIGHT_PARAMS
+        out_dir = os.path.join(raiz, "outputs")
+        for d in ("grids", "logs", "outputs"):
+            os.makedirs(os.path.join(raiz, d))
+        t = {}
+
+        inicio = time.perf_counter()
+        impressoes = {}
+        pendentes = runs.alvos_pendentes(alvos, s, out_dir, False, impressoes)
+        t["impressoes"] = time.perf_counter() - inicio
+
+        # Sem histórico: mede o preditor por pixels válidos, o caso mais caro
+        inicio = time.perf_counter()
+        custos = None
+        if config.ORDENAR_JOBS:
+            custos, _ = scheduler.prever_custos(pendentes, s, {})
+        t["previsao"] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        chunk_size = config.CHUNK_SIZE or scheduler.escolher_chunk_size(len(pendentes), n_workers)
+        jobs = runs.montar_jobs(
+            pendentes,
+            s,
+            runs.preparar_base_dir(s),
+            chunk_size,
+            os.path.join(raiz, "grids"),
+            os.path.join(raiz, "logs"),
+            out_dir,
+            custos=custos,
+        )
+        t["grids"] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            resultados = scheduler.executar_jobs(jobs, n_workers, cwd=raiz)
+        t["execucao"] = time.perf_counter() - inicio
+
+        out_paths = sorted(os.path.join(out_dir, f"{a}.out") for a in alvos)
+        runs.colher_resultados(out_paths[:1], 1)  # importa pandas fora da medição
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            runs.colher_resultados(out_paths, 1)
+        t["colheita_serial"] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            df = runs.colher_resultados(out_paths, n_workers)
+        t["colheita"] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        runs.escrever_summary(df, out_dir)
+        t["summary"] = time.perf_counter() - inicio
+
+    ocupado = sum(r["tempo"] for r in resultados)
+    return {
+        "alvos": n_alvos,
+        "workers": n_workers,
+        "grids": len(jobs),
+        "chunk": chunk_size,
+        "falhas": sum(not r["ok"] for r in resultados),
+        "linhas_summary": len(df),
+        "tempos": t,
+        "overhead": sum(v for k, v in t.items() if k not in ("execucao", "colheita_serial")),
+        "eficiencia_scheduler": ocupado / (n_workers * t["execucao"]) if t["execucao"] else 0.0,
+        "ajustes_por_s": n_alvos / t["execucao"] if t["execucao"] else 0.0,
+        "colheita_por_s": n_alvos / t["colheita"] if t["colheita"] else 0.0,
+        "colheita_serial_por_s": n_alvos / t["colheita_serial"] if t["colheita_serial"] else 0.0,
+    }
+
+
+def imprimir(resultado):
+    t = resultado["tempos"]
+    print(
+        f"\n  > {resultado['alvos']} alvos, {resultado['workers']} workers, "
+        f"{resultado['grids']} grids de até {resultado['chunk']} ajustes "
+        f"({resultado['falhas']} falhas, {resultado['linhas_summary']} linhas no summary)"
+    )
+    for fase, segundos in t.items():
+        print(f"      {fase:<16s} {segundos:9.3f} s")
+    print(f"      {'overhead':<16s} {resultado['overhead']:9.3f} s (fora a execução)")
+    print(f"      eficiência do scheduler: {resultado['eficiencia_scheduler']:.1%}")
+    print(
+        f"      vazão: {resultado['ajustes_por_s']:.1f} ajustes/s, colheita "
+        f"{resultado['colheita_por_s']:.0f} .out/s ({resultado['colheita_serial_por_s']:.0f} serial)"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="benchmark.py", description="Benchmark da pipeline com o STARLIGHT simulado"
+    )
+    parser.add_argument(
+        "--tamanhos",
+        type=lambda v: [int(x) for x in v.split(",")],
+        default=list(TAMANHOS),
+        help="Números de alvos, separados por vírgula (padrão: 10,1000,10000)",
+    )
+    parser.add_argument("--workers", type=int, default=runs.numero_workers())
+    parser.add_argument(
+        "--tempo-ajuste", type=float, default=0.0, help="Tempo simulado de um ajuste [s]"
+    )
+    parser.add_argument(
+        "--carga", type=float, default=0.0, help="Tempo simulado de carga da base [s]"
+    )
+    parser.add_argument("--saida", help="Grava os resultados em JSON")
+    args = parser.parse_args(argv)
+
+    resultados = []
+    for n in args.tamanhos:
+        resultado = medir(n, args.workers, args.tempo_ajuste, args.carga)
+        imprimir(resultado)
+        resultados.append(resultado)
+
+    if args.saida:
+        with open(args.saida, "w") as f:
+            json.dump(resultados, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
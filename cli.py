@@ -0,0 +1,254 @@
+import argparse
+import glob
+import os
+import sys
+
+import config
+
+# Os módulos da pipeline (e numpy/scipy/astropy/matplotlib) só são importados pelo
+# subcomando que precisa deles, então comandos curtos como "alvos" respondem na hora.
+
+
+def cmd_alvos(args):
+    if args.entradas:
+        arquivos = sorted(glob.glob(os.path.join(config.INPUTS_DIR, "*.in")))
+        for f in arquivos:
+            print(os.path.basename(f)[: -len(".in")])
+        return 0
+
+    import waggs
+
+    targets = waggs.descobrir_alvos(waggs.WAGGS_DIR, verboso=False)
+    for target_name in sorted(targets):
+        print(f"{target_name}  [{''.join(sorted(targets[target_name]))}]")
+    return 0
+
+
+def cmd_waggs(args):
+    import waggs
+
+    if args.workers is not None:
+        waggs.n_workers = args.workers
+    if args.lote:
+        waggs.lote = True
+    if args.operadores:
+        waggs.lote = True
+        waggs.usar_operadores = True
+    if args.forcar:
+        waggs.forcar = True
+    if args.plots is not None:
+        waggs.plots = {"todos": True, "sinalizados": "sinalizados", "nenhum": False}[
+            args.plots
+        ]
+    waggs.main()
+    return 0
+
+
+def cmd_plots(args):
+    import waggs
+
+    alvos = args.alvos
+    if not alvos:
+        arquivos = sorted(glob.glob(os.path.join(waggs.OUTPUT_IN_DIR, "*.in")))
+        alvos = [os.path.basename(f)[: -len(".in")] for f in arquivos]
+    modo = "sinalizados" if args.sinalizados else True
+    n_workers = args.workers if args.workers is not None else waggs.n_workers_plots
+    falhas = waggs.renderizar_plots(alvos, modo=modo, n_workers=n_workers)
+    return 1 if falhas else 0
+
+
+def cmd_miles(args):
+    import miles
+
+    filtros = {
+        "idade_min": args.idade_min,
+        "idade_max": args.idade_max,
+        "mh_min": args.mh_min,
+        "mh_max": args.mh_max,
+    }
+    if args.base is None:
+        miles.run()
+    else:
+        miles.run(args.base, **filtros)
+    return 0
+
+
+def cmd_runs(args):
+    import runs
+
+    if args.todos:
+        arquivos = sorted(glob.glob(os.path.join(config.INPUTS_DIR, "*.in")))
+        alvos = [os.path.basename(f)[: -len(".in")] for f in arquivos]
+    else:
+        alvos = args.alvos or None
+    runs.main(alvos, retomar=args.retomar, streaming=args.streaming)
+    return 0
+
+
+def cmd_sweep(args):
+    import json
+
+    import sweep
+
+    with open(args.grade, "r") as f:
+        grade = json.load(f)
+    if args.todos:
+        arquivos = sorted(glob.glob(os.path.join(config.INPUTS_DIR, "*.in")))
+        alvos = [os.path.basename(f)[: -len(".in")] for f in arquivos]
+    else:
+        alvos = args.alvos or None
+    nome = args.nome or os.path.splitext(os.path.basename(args.grade))[0]
+    sweep.main(grade, alvos, nome=nome, retomar=args.retomar)
+    return 0
+
+
+def cmd_mc(args):
+    import montecarlo
+
+    if args.todos:
+        arquivos = sorted(glob.glob(os.path.join(config.INPUTS_DIR, "*.in")))
+        alvos = [os.path.basename(f)[: -len(".in")] for f in arquivos]
+    else:
+        alvos = args.alvos or None
+    montecarlo.main(alvos, n_realizacoes=args.n, semente=args.semente, retomar=args.retomar)
+    return 0
+
+
+def cmd_exportar(args):
+    import acervo
+    import runs
+
+    n_workers = args.workers if args.workers is not None else runs.numero_workers()
+    total = acervo.exportar_existentes(args.runs, n_workers=n_workers, espectro=args.espectro)
+    return 1 if total is None else 0
+
+
+def cmd_worker(args):
+    import fila
+
+    if args.limpar_staging:
+        import staging
+
+        staging.limpar()
+        return 0
+    fila.worker(args.fila, n_workers=args.workers, esperar=args.esperar)
+    return 0
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description="Pipeline STARLIGHT WAGGS"
+    )
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("alvos", help="Lista os alvos WAGGS disponíveis")
+    p.add_argument(
+        "--entradas", action="store_true", help="Lista os alvos já pré-processados (.in)"
+    )
+    p.set_defaults(func=cmd_alvos)
+
+    p = sub.add_parser("waggs", help="Pré-processa os espectros WAGGS em arquivos .in")
+    p.add_argument("--workers", type=int, help="Processos simultâneos (1 = serial)")
+    p.add_argument("--lote", action="store_true", help="Usa o motor vetorizado em lote")
+    p.add_argument(
+        "--operadores",
+        action="store_true",
+        help="Motor em lote com operadores esparsos (.in iguais só até a precisão float32)",
+    )
+    p.add_argument("--forcar", action="store_true", help="Ignora o manifest")
+    p.add_argument("--plots", choices=("todos", "sinalizados", "nenhum"))
+    p.set_defaults(func=cmd_waggs)
+
+    p = sub.add_parser("plots", help="Gera os gráficos de diagnóstico sob demanda")
+    p.add_argument("alvos", nargs="*", help="Alvos (padrão: todos os .in)")
+    p.add_argument("--sinalizados", action="store_true", help="Só alvos sinalizados")
+    p.add_argument("--workers", type=int)
+    p.set_defaults(func=cmd_plots)
+
+    p = sub.add_parser("miles", help="Converte a biblioteca MILES e gera uma base")
+    p.add_argument("--base", help="Nome da base (sem ele, a seleção é interativa)")
+    p.add_argument("--idade-min", type=float, help="Idade mínima [Gyr]")
+    p.add_argument("--idade-max", type=float, help="Idade máxima [Gyr]")
+    p.add_argument("--mh-min", type=float, help="[M/H] mínimo")
+    p.add_argument("--mh-max", type=float, help="[M/H] máximo")
+    p.set_defaults(func=cmd_miles)
+
+    p = sub.add_parser("runs", help="Roda o STARLIGHT nos alvos pré-processados")
+    p.add_argument("alvos", nargs="*", help="Alvos (padrão: seleção interativa)")
+    p.add_argument("--todos", action="store_true", help="Roda todos os .in")
+    p.add_argument(
+        "--retomar",
+        action="store_true",
+        help="Mantém os .out completos e atualizados e roda só os que faltam",
+    )
+    p.add_argument(
+        "--streaming",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Atualiza o summary.csv a cada grid concluído (padrão: config.STREAMING_SUMMARY)",
+    )
+    p.set_defaults(func=cmd_runs)
+
+    p = sub.add_parser("sweep", help="Roda uma varredura de parâmetros do STARLIGHT")
+    p.add_argument(
+        "grade",
+        help='JSON com {"parâmetro": [valores]} (produto cartesiano) ou lista de configurações',
+    )
+    p.add_argument("alvos", nargs="*", help="Alvos (padrão: seleção interativa)")
+    p.add_argument("--todos", action="store_true", help="Roda todos os .in")
+    p.add_argument("--nome", help="Nome da varredura (padrão: nome do arquivo da grade)")
+    p.add_argument(
+        "--retomar", action="store_true", help="Mantém os .out completos e atualizados"
+    )
+    p.set_defaults(func=cmd_sweep)
+
+    p = sub.add_parser("mc", help="Incertezas por Monte Carlo (fluxo perturbado pelo erro)")
+    p.add_argument("alvos", nargs="*", help="Alvos (padrão: seleção interativa)")
+    p.add_argument("--todos", action="store_true", help="Usa todos os .in")
+    p.add_argument("-n", type=int, help="Realizações por alvo (padrão: config.MC_REALIZACOES)")
+    p.add_argument("--semente", type=int, help="Semente base (padrão: config.MC_SEMENTE)")
+    p.add_argument(
+        "--retomar", action="store_true", help="Mantém os .out completos e atualizados"
+    )
+    p.set_defaults(func=cmd_mc)
+
+    p = sub.add_parser(
+        "exportar", help="Exporta os .out existentes para o acervo Parquet (config.ACERVO_DIR)"
+    )
+    p.add_argument(
+        "runs",
+        nargs="*",
+        help='Partições run: "runs", "montecarlo", "sweep-<nome>" (padrão: todas)',
+    )
+    p.add_argument("--workers", type=int, help="Processos de leitura")
+    p.add_argument(
+        "--espectro",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Exporta também o espectro sintético (padrão: config.ACERVO_ESPECTRO)",
+    )
+    p.set_defaults(func=cmd_exportar)
+
+    p = sub.add_parser("worker", help="Roda grids da fila compartilhada (EXECUTOR = 'fila')")
+    p.add_argument("--fila", help="Arquivo da fila (padrão: config.FILA_ARQUIVO)")
+    p.add_argument("--workers", type=int, help="Grids simultâneos neste nó")
+    p.add_argument(
+        "--esperar", action="store_true", help="Continua esperando com a fila vazia"
+    )
+    p.add_argument(
+        "--limpar-staging",
+        action="store_true",
+        help="Só apaga as áreas de staging deste nó (config.STAGING_DIR) e sai",
+    )
+    p.set_defaults(func=cmd_worker)
+
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
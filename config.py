@@ -31,5 +31,46 @@ STARLIGHT_PARAMS = {
     "vd": 150.0,
 }
 
+# Base recortada e reamostrada para a janela do ajuste (miles.preparar_base_recortada)
+USE_BASE_CACHE = True
+
+# Resultados
+STREAMING_SUMMARY = True  # True = summary.csv atualizado a cada grid concluído
+SUMMARY_PARQUET = False  # True = grava também outputs/summary.parquet (requer pyarrow)
+
+# Acervo colunar (acervo.py): header, populações e espectros de todos os .out em Parquet,
+# particionado por run e configuração (requer pyarrow)
+EXPORTAR_ACERVO = False  # True = exporta ao fim de runs, sweep e mc
+ACERVO_DIR = os.path.join(PIPELINE_DIR, "acervo")
+ACERVO_ESPECTRO = True  # False = só header e populações (o espectro é quase todo o volume)
+ACERVO_COMPRESSAO = "zstd"
+ACERVO_LOTE = 256  # .out por row group
+
+# Monte Carlo (montecarlo.py): realizações com o fluxo perturbado pela coluna de erro do .in
+MC_REALIZACOES = 100  # Realizações por alvo
+MC_SEMENTE = 20240101  # Semente base (cada realização tem um gerador: semente, nome, índice)
+MC_PERCENTIS = (16, 50, 84)  # Percentis das distribuições no resumo
+MC_MANTER_ENTRADAS = False  # False = apaga os .in perturbados assim que o grid termina
+
 # Configuração de Paralelização
-CHUNK_SIZE = 1
+CHUNK_SIZE = None  # Ajustes por processo do STARLIGHT (None = escolha automática)
+CUSTO_CARGA_BASE = 5.0  # Tempo estimado para o STARLIGHT carregar a base [s]
+CUSTO_MEDIO_AJUSTE = 60.0  # Tempo estimado de um ajuste [s]
+JOB_TIMEOUT = 3600  # Limite por ajuste [s] (None = sem limite)
+JOB_RETRIES = 2  # Novas tentativas para grids que falharam
+ORDENAR_JOBS = True  # True = grids com carga equilibrada, submetidos do mais caro ao mais barato
+HISTORICO_TEMPOS = os.path.join(PIPELINE_DIR, "historico_tempos.json")  # Tempo de cada ajuste
+
+# Staging local (staging.py): base, máscara, configuração e entradas de cada grid são copiadas
+# para um diretório rápido do nó, de onde o STARLIGHT roda sem ler do disco compartilhado
+STAGING = False
+STAGING_DIR = None  # None = /dev/shm/starlight_<usuário> (ou o diretório temporário do sistema)
+STAGING_RETENCAO = 3600  # Áreas sem uso há mais que isto [s] são removidas ao criar uma nova
+
+# Execução em vários nós (fila.py): "local" = pool de threads nesta máquina; "fila" = grids
+# publicados numa fila SQLite em disco compartilhado e rodados por "python cli.py worker"
+EXECUTOR = "local"
+FILA_ARQUIVO = os.path.join(PIPELINE_DIR, "fila.sqlite")
+FILA_LEASE = 300  # Validade do lease de um job [s], renovado a cada FILA_LEASE / 3
+FILA_MAX_ENTREGAS = 3  # Entregas (workers mortos) antes de o job ser dado como falho
+FILA_INTERVALO = 2.0  # Espera entre consultas à fila [s]
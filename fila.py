@@ -0,0 +1,348 @@
+import importlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import scheduler
+
+# Fila de grids num arquivo SQLite em disco compartilhado: o coordenador publica os jobs e
+# workers em qualquer nó pegam, rodam e confirmam. Cada job pego tem um lease renovado enquanto
+# o STARLIGHT roda; se o worker morre, o lease expira e o job volta para a fila.
+#
+# O SQLite depende do lock de arquivo do sistema de arquivos: use um disco compartilhado com
+# locks POSIX funcionais (NFSv4, Lustre, BeeGFS...). Em NFSv3 sem lockd, aponte FILA_ARQUIVO
+# para um disco local do nó coordenador exportado com locks.
+
+ESTADOS = ("pendente", "executando", "concluido")
+
+
+def conectar(path=None):
+    path = path or config.FILA_ARQUIVO
+    con = sqlite3.connect(path, timeout=60, isolation_level=None)
+    con.execute(
+        """CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            lote TEXT,
+            job TEXT,
+            estado TEXT DEFAULT 'pendente',
+            dono TEXT,
+            expira REAL,
+            entregas INTEGER DEFAULT 0,
+            resultado TEXT
+        )"""
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS jobs_estado ON jobs (estado, id)")
+    return con
+
+
+def _serializar(job):
+    """
+    Job -> JSON. 'preparar' (função) vira "modulo:funcao" e é importado de volta no worker.
+    """
+    job = dict(job)
+    if callable(job.get("preparar")):
+        job["preparar"] = f"{job['preparar'].__module__}:{job['preparar'].__name__}"
+    return json.dumps(job)
+
+
+def _desserializar(texto):
+    job = json.loads(texto)
+    if isinstance(job.get("preparar"), str):
+        modulo, funcao = job["preparar"].split(":")
+        job["preparar"] = getattr(importlib.import_module(modulo), funcao)
+    return job
+
+
+def publicar(jobs, path=None):
+    """
+    Coloca os jobs na fila com um identificador de lote novo.
+
+    Returns:
+        str: Identificador do lote
+    """
+    lote = uuid.uuid4().hex
+    con = conectar(path)
+    with con:
+        con.execute("BEGIN IMMEDIATE")
+        con.executemany(
+            "INSERT INTO jobs (lote, job) VALUES (?, ?)",
+            [(lote, _serializar(job)) for job in jobs],
+        )
+    con.close()
+    return lote
+
+
+def _recolher_expirados(con, agora):
+    """
+    Devolve à fila os jobs com lease expirado (ou os encerra como falha, se já foram
+    entregues config.FILA_MAX_ENTREGAS vezes). Roda dentro de uma transação aberta.
+
+    Returns:
+        int: Número de jobs recolhidos
+    """
+    expirados = con.execute(
+        "SELECT id, job, entregas FROM jobs WHERE estado = 'executando' AND expira < ?",
+        (agora,),
+    ).fetchall()
+    for id_, texto, entregas in expirados:
+        if entregas >= config.FILA_MAX_ENTREGAS:
+            job = json.loads(texto)
+            resultado = {
+                **job,
+                "ok": False,
+                "tentativas": entregas,
+                "erro": f"lease expirado {entregas} vezes",
+                "faltando": job["alvos"],
+                "tempo": 0.0,
+                "metricas": [],
+            }
+            con.execute(
+                "UPDATE jobs SET estado = 'concluido', resultado = ? WHERE id = ?",
+                (json.dumps(resultado), id_),
+            )
+        else:
+            con.execute("UPDATE jobs SET estado = 'pendente', dono = NULL WHERE id = ?", (id_,))
+    return len(expirados)
+
+
+def recolher_expirados(con):
+    """
+    Recolhe os leases expirados fora de pegar: o coordenador também o faz, para que jobs de
+    workers mortos não fiquem presos quando nenhum worker está pegando jobs.
+
+    Returns:
+        int: Número de jobs recolhidos
+    """
+    with con:
+        con.execute("BEGIN IMMEDIATE")
+        return _recolher_expirados(con, time.time())
+
+
+def pegar(con, dono, lease=None):
+    """
+    Pega o próximo job pendente e o marca como do worker dono até time() + lease.
+    Antes, recolhe os jobs com lease expirado (_recolher_expirados).
+
+    Returns:
+        tuple: (id, job) ou None se não há job pendente
+    """
+    lease = lease or config.FILA_LEASE
+    agora = time.time()
+    with con:
+        con.execute("BEGIN IMMEDIATE")
+        _recolher_expirados(con, agora)
+
+        linha = con.execute(
+            "SELECT id, job FROM jobs WHERE estado = 'pendente' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if linha is None:
+            return None
+        con.execute(
+            "UPDATE jobs SET estado = 'executando', dono = ?, expira = ?, "
+            "entregas = entregas + 1 WHERE id = ?",
+            (dono, agora + lease, linha[0]),
+        )
+    return linha[0], _desserializar(linha[1])
+
+
+def renovar(con, id_, dono, lease=None):
+    """
+    Estende o lease de um job. Retorna False se o job não é mais deste worker.
+    """
+    lease = lease or config.FILA_LEASE
+    with con:
+        cur = con.execute(
+            "UPDATE jobs SET expira = ? WHERE id = ? AND dono = ? AND estado = 'executando'",
+            (time.time() + lease, id_, dono),
+        )
+    return cur.rowcount == 1
+
+
+def confirmar(con, id_, dono, resultado):
+    """
+    Marca o job como concluído. Um worker cujo lease expirou (e o job foi reentregue)
+    não sobrescreve o resultado do novo dono.
+    """
+    resultado = {k: v for k, v in resultado.items() if k != "preparar"}
+    with con:
+        con.execute(
+            "UPDATE jobs SET estado = 'concluido', resultado = ? "
+            "WHERE id = ? AND dono = ? AND estado = 'executando'",
+            (json.dumps(resultado), id_, dono),
+        )
+
+
+def contar(con, lote=None):
+    """
+    Returns:
+        dict: Número de jobs por estado (de um lote ou da fila toda)
+    """
+    filtro, args = ("WHERE lote = ?", (lote,)) if lote else ("", ())
+    linhas = con.execute(f"SELECT estado, COUNT(*) FROM jobs {filtro} GROUP BY estado", args)
+    contagem = dict.fromkeys(ESTADOS, 0)
+    contagem.update(dict(linhas.fetchall()))
+    return contagem
+
+
+def _executar_com_lease(path, dono, id_, job, lease):
+    """
+    Roda um job renovando o lease a cada lease/3 s numa thread auxiliar. Se o lease é
+    perdido (expirou e o job foi reentregue, ou a renovação falhou), o STARLIGHT em execução
+    é morto e o resultado sai marcado como falha: o job pertence ao novo dono, e confirmar
+    não grava este resultado.
+    """
+    parar = threading.Event()
+    perdido = threading.Event()
+
+    def manter():
+        # Conexões SQLite não podem ser compartilhadas entre threads
+        con_lease = None
+        try:
+            con_lease = conectar(path)
+            while not parar.wait(lease / 3):
+                if not renovar(con_lease, id_, dono, lease):
+                    motivo = "o job foi reentregue a outro worker"
+                    break
+            else:
+                return
+        except Exception as e:
+            # Sem renovar não há como saber se o lease ainda vale: trata como perdido
+            motivo = f"renovação falhou ({e})"
+        finally:
+            if con_lease is not None:
+                con_lease.close()
+        perdido.set()
+        print(f"  [AVISO] {os.path.basename(job['grid'])} ({dono}): lease perdido; {motivo}.")
+
+    t = threading.Thread(target=manter, daemon=True)
+    t.start()
+    try:
+        resultado = scheduler.executar_job(
+            job,
+            timeout=job.get("limite_tempo"),
+            tentativas=job.get("novas_tentativas"),
+            cancelar=perdido,
+        )
+    except Exception as e:
+        resultado = {
+            **job,
+            "ok": False,
+            "tentativas": 0,
+            "erro": str(e),
+            "faltando": job["alvos"],
+            "tempo": 0.0,
+            "metricas": [],
+        }
+    finally:
+        parar.set()
+        t.join()
+    if perdido.is_set():
+        return {**resultado, "ok": False, "erro": "lease perdido"}
+    con = conectar(path)
+    confirmar(con, id_, dono, resultado)
+    con.close()
+    return resultado
+
+
+def worker(path=None, n_workers=None, esperar=False, intervalo=None):
+    """
+    Worker de um nó: roda até n_workers grids em paralelo, pegando jobs da fila.
+    Termina quando a fila não tem jobs pendentes nem em execução (ou nunca, com esperar).
+
+    Args:
+        path [str]: Arquivo da fila (padrão: config.FILA_ARQUIVO)
+        n_workers [int]: Grids simultâneos neste nó (padrão: 5/6 dos núcleos)
+        esperar [bool]: Continua esperando novos jobs com a fila vazia
+        intervalo [float]: Espera entre consultas à fila vazia [s]
+    """
+    path = path or config.FILA_ARQUIVO
+    intervalo = intervalo or config.FILA_INTERVALO
+    lease = config.FILA_LEASE
+    if n_workers is None:
+        n_workers = max(1, int((os.cpu_count() or 1) * (5 / 6)))
+    prefixo = f"{socket.gethostname()}:{os.getpid()}"
+
+    def laco(i):
+        dono = f"{prefixo}:{i}"
+        con = conectar(path)
+        feitos = 0
+        while True:
+            pego = pegar(con, dono, lease)
+            if pego is None:
+                if not esperar and contar(con)["executando"] == 0:
+                    break
+                time.sleep(intervalo)
+                continue
+            id_, job = pego
+            resultado = _executar_com_lease(path, dono, id_, job, lease)
+            status = "CONCLUÍDO" if resultado["ok"] else "FALHOU"
+            print(f"  [{status}] {os.path.basename(job['grid'])} ({dono})")
+            feitos += 1
+        con.close()
+        return feitos
+
+    print(f"  > Worker {prefixo}: {n_workers} grids simultâneos, fila {path}")
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        total = sum(executor.map(laco, range(n_workers)))
+    print(f"  > Worker {prefixo}: {total} grids rodados.")
+    return total
+
+
+def executar_jobs_fila(jobs, timeout=None, tentativas=None, ao_concluir=None, path=None):
+    """
+    Backend de fila do scheduler: publica os jobs e espera os workers (cli.py worker, em
+    qualquer nó com acesso ao disco compartilhado). ao_concluir é chamado com cada resultado
+    assim que o job é confirmado, como em scheduler.executar_jobs.
+
+    Returns:
+        list: Resultados, na ordem de conclusão
+    """
+    path = path or config.FILA_ARQUIVO
+    jobs = [{**job, "limite_tempo": timeout, "novas_tentativas": tentativas} for job in jobs]
+    lote = publicar(jobs, path)
+    print(f"  > {len(jobs)} grids publicados na fila {path}.")
+    print("  > Inicie os workers nos nós de execução com: python cli.py worker\n")
+
+    con = conectar(path)
+    vistos = set()
+    resultados = []
+    ultimo_progresso = time.monotonic()
+    while len(vistos) < len(jobs):
+        linhas = con.execute(
+            "SELECT id, resultado FROM jobs WHERE lote = ? AND estado = 'concluido'", (lote,)
+        ).fetchall()
+        novos = [(i, r) for i, r in linhas if i not in vistos]
+        for id_, texto in novos:
+            vistos.add(id_)
+            resultado = json.loads(texto)
+            status = "CONCLUÍDO" if resultado["ok"] else "FALHOU"
+            print(f"  [{status}] {os.path.basename(resultado['grid'])}")
+            if ao_concluir is not None:
+                ao_concluir(resultado)
+            resultados.append(resultado)
+        if novos:
+            ultimo_progresso = time.monotonic()
+            continue
+        # Leases de workers mortos expiram mesmo sem nenhum worker pegando jobs
+        if recolher_expirados(con):
+            ultimo_progresso = time.monotonic()
+        parado = time.monotonic() - ultimo_progresso
+        if parado > config.FILA_LEASE:
+            contagem = contar(con, lote)
+            print(
+                f"  [AVISO] Fila sem progresso há {parado:.0f} s "
+                f"({contagem['pendente']} pendentes, {contagem['executando']} em execução): "
+                "há workers rodando? (python cli.py worker)"
+            )
+            ultimo_progresso = time.monotonic()
+        time.sleep(config.FILA_INTERVALO)
+    with con:
+        con.execute("DELETE FROM jobs WHERE lote = ?", (lote,))
+    con.close()
+    return resultados
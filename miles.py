@@ -1,9 +1,12 @@
+import hashlib
+import json
 import os
 import re
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
-import astropy.io.fits as fits
 import numpy as np
-from astropy.wcs import WCS
+
+import spec_io
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = SCRIPT_DIR
@@ -14,6 +17,17 @@ MASS_FILE = os.path.join(
     PROJECT_ROOT, "Starlightv04", "MILES_PADOVA00_KU_baseFe", "out_mass_KU_PADOVA00"
 )
 OUTPUT_BASE_DIR = os.path.join(PROJECT_ROOT, "Starlightv04", "BaseFiles")
+# Fora de SPEC_DIR: escrever o índice não pode alterar o mtime do diretório indexado
+CATALOG_FILE = os.path.join(PROJECT_ROOT, "Starlightv04", "catalogo_ssp.json")
+BASE_CACHE_DIR = os.path.join(PROJECT_ROOT, "Starlightv04", "BasesCache")
+# Biblioteca consolidada: fluxos (N_ssp, N_lambda) + eixo de lambda + tabela de metadados
+LIBRARY_DIR = os.path.join(PROJECT_ROOT, "Starlightv04", "BibliotecaSSP")
+USE_LIBRARY_STORE = True  # True = .spec gerados sob demanda a partir da biblioteca
+MARGEM_BASE = 100.0  # Angstroms mantidos além da janela do ajuste (cinemática)
+
+SIDECAR_NPY = False  # True = salva também {arquivo}.spec.npy
+N_WORKERS = max(1, int((os.cpu_count() or 1) * (5 / 6)))  # 1 = conversão serial
+MAX_PENDENTES_POR_WORKER = 2  # Limita os arquivos em memória ao mesmo tempo
 
 Z_SUN = 0.019  # Referência ???
 
@@ -21,15 +35,7 @@ pattern = re.compile(r"Mku1.30Z([mp])(\d+\.\d+)T(\d+\.\d+)")
 
 
 def get_data_from_fits(filepath):
-    with fits.open(filepath) as file:
-        flux = file[0].data
-        header = file[0].header
-        wcs = WCS(header)
-        pixel_indices = np.arange(len(flux))
-        lambdas = wcs.pixel_to_world_values(pixel_indices)
-        if isinstance(lambdas, tuple):
-            lambdas = lambdas[0]
-    return lambdas, flux
+    return spec_io.ler_fits(filepath)
 
 
 def load_mass_map(filepath):
@@ -46,50 +52,516 @@ def load_mass_map(filepath):
     return mass_map
 
 
-def convert_fits_to_spec(fits_path, spec_dir):
+def converter_arquivo(filepath, output_filepath):
+    """
+    Converte um FITS da MILES em .spec. A escrita é atômica (temporário + rename), então uma
+    interrupção nunca deixa um .spec truncado que seria pulado nas próximas execuções.
+
+    Returns:
+        tuple: (filepath, mensagem de erro ou None)
+    """
+    try:
+        lambdas, flux = get_data_from_fits(filepath)
+        spec_io.escrever_spec(output_filepath, lambdas, flux, sidecar=SIDECAR_NPY)
+    except Exception as e:
+        return filepath, str(e)
+    return filepath, None
+
+
+def convert_fits_to_spec(fits_path, spec_dir, n_workers=None):
     print("Verificando/Convertendo FITS para SPEC")
+    if n_workers is None:
+        n_workers = N_WORKERS
+    os.makedirs(spec_dir, exist_ok=True)
+
+    # Restos de uma execução interrompida
+    for f in os.listdir(spec_dir):
+        if f.endswith(".tmp") or f.endswith(".tmp.npy"):
+            os.remove(os.path.join(spec_dir, f))
+
     fits_files = []
-    all_dotfits = os.listdir(FITS_PATH)
+    all_dotfits = os.listdir(fits_path)
     for f in all_dotfits:
         if f.endswith(".fits"):
             fits_files.append(f)
-    converted_count = 0
 
+    tarefas = []
     for filename in fits_files:
         filepath = os.path.join(fits_path, filename)
         output_filename = filename.replace(".fits", ".spec")
         output_filepath = os.path.join(spec_dir, output_filename)
 
         if not os.path.exists(output_filepath):
-            lambdas, flux = get_data_from_fits(filepath)
-            np.savetxt(output_filepath, np.column_stack((lambdas, flux)))
-            converted_count += 1
-
+            tarefas.append((filepath, output_filepath))
+
+    falhas = {}
+    if n_workers <= 1 or len(tarefas) <= 1:
+        for filepath, output_filepath in tarefas:
+            _, erro = converter_arquivo(filepath, output_filepath)
+            if erro is not None:
+                falhas[filepath] = erro
+    else:
+        # Submissão limitada: no máximo n_workers * MAX_PENDENTES_POR_WORKER em voo
+        limite = n_workers * MAX_PENDENTES_POR_WORKER
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            restantes = iter(tarefas)
+            em_voo = set()
+            while True:
+                for filepath, output_filepath in restantes:
+                    em_voo.add(executor.submit(converter_arquivo, filepath, output_filepath))
+                    if len(em_voo) >= limite:
+                        break
+                if not em_voo:
+                    break
+                prontos, em_voo = wait(em_voo, return_when=FIRST_COMPLETED)
+                for future in prontos:
+                    try:
+                        filepath, erro = future.result()
+                    except Exception as e:
+                        filepath, erro = "?", str(e)
+                    if erro is not None:
+                        falhas[filepath] = erro
+
+    for filepath, erro in falhas.items():
+        print(f"  [ERRO] Falha: {os.path.basename(filepath)}: {erro}")
+
+    converted_count = len(tarefas) - len(falhas)
     if converted_count > 0:
         print(
             f"Processamento concluído: {converted_count} novos arquivos .spec gerados."
         )
-    else:
+    elif not falhas:
         print("Todos os arquivos .spec já existem. Pulando conversão.")
 
-    return True
-
-
-def select_ages_and_metallicities():
-    all_specs = os.listdir(SPEC_DIR)
-    ages_list = set()
-    mh_list = set()
-    for f in all_specs:
-        if f.endswith(".spec"):
-            match = pattern.search(f)
-            if match:
-                sign, z_val, age_gyr_str = match.groups()
-                mh_val = float(z_val) * (-1 if sign == "m" else 1)
-                age_gyr = float(age_gyr_str)
-                ages_list.add(age_gyr)
-                mh_list.add(mh_val)
-    ages_list = sorted(list(ages_list))
-    mh_list = sorted(list(mh_list))
+    return not falhas
+
+
+def _faixa_lambda(spec_path):
+    """
+    Primeiro e último lambda de um .spec, lendo só o começo e o fim do arquivo.
+    """
+    with open(spec_path, "rb") as f:
+        primeira = f.readline()
+        f.seek(0, os.SEEK_END)
+        tamanho = f.tell()
+        f.seek(max(0, tamanho - 4096))
+        ultima = f.read().rstrip().splitlines()[-1]
+    return float(primeira.split()[0]), float(ultima.split()[0])
+
+
+def _assinatura(spec_dir, mass_file):
+    """
+    Identifica o estado do diretório: o mtime muda quando arquivos são criados, removidos
+    ou substituídos (as escritas do spec_io usam rename).
+    """
+    mass_mtime = os.stat(mass_file).st_mtime_ns if os.path.exists(mass_file) else None
+    return {
+        "spec_dir": os.path.abspath(spec_dir),
+        "dir_mtime": os.stat(spec_dir).st_mtime_ns,
+        "mass_mtime": mass_mtime,
+    }
+
+
+def construir_catalogo(spec_dir=SPEC_DIR, mass_file=MASS_FILE, anterior=None):
+    """
+    Índice de todas as SSPs de spec_dir: arquivo, [M/H], idade, Mstar e faixa de lambda.
+    Entradas de `anterior` são reaproveitadas para arquivos com mesmo tamanho e mtime.
+
+    Returns:
+        list: Um dict por SSP, ordenado pelo nome do arquivo
+    """
+    mass_map = load_mass_map(mass_file) if os.path.exists(mass_file) else {}
+    anteriores = {e["file"]: e for e in (anterior or [])}
+
+    catalogo = []
+    for filename in sorted(os.listdir(spec_dir)):
+        if not filename.endswith(".spec"):
+            continue
+        match = pattern.search(filename)
+        if not match:
+            continue
+
+        st = os.stat(os.path.join(spec_dir, filename))
+        entrada = anteriores.get(filename)
+        if (
+            entrada is None
+            or entrada["tamanho"] != st.st_size
+            or entrada["mtime"] != st.st_mtime_ns
+        ):
+            sign, z_val, age_gyr_str = match.groups()
+            lmin, lmax = _faixa_lambda(os.path.join(spec_dir, filename))
+            entrada = {
+                "file": filename,
+                "sign": sign,
+                "z_val": z_val,
+                "mh": float(z_val) * (-1 if sign == "m" else 1),
+                "age_gyr": float(age_gyr_str),
+                "lambda_min": lmin,
+                "lambda_max": lmax,
+                "tamanho": st.st_size,
+                "mtime": st.st_mtime_ns,
+            }
+        entrada["mstar"] = mass_map.get(
+            (round(entrada["mh"], 2), round(entrada["age_gyr"], 4)), 1.0000
+        )
+        catalogo.append(entrada)
+    return catalogo
+
+
+def carregar_catalogo(spec_dir=SPEC_DIR, mass_file=MASS_FILE, catalog_file=CATALOG_FILE):
+    """
+    Lê o índice persistente das SSPs, reconstruindo-o só se spec_dir ou o arquivo de massas mudaram.
+
+    Returns:
+        list: Um dict por SSP (ver construir_catalogo)
+    """
+    assinatura = _assinatura(spec_dir, mass_file)
+    anterior = None
+    if os.path.exists(catalog_file):
+        try:
+            with open(catalog_file, "r") as f:
+                dados = json.load(f)
+            if dados.get("assinatura") == assinatura:
+                return dados["ssps"]
+            anterior = dados.get("ssps")
+        except (OSError, ValueError, KeyError):
+            anterior = None
+
+    catalogo = construir_catalogo(spec_dir, mass_file, anterior)
+    tmp = catalog_file + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"assinatura": assinatura, "ssps": catalogo}, f)
+    os.replace(tmp, catalog_file)
+    return catalogo
+
+
+def catalogo_padrao():
+    """
+    Catálogo usado quando nenhum é dado: com USE_LIBRARY_STORE e a biblioteca consolidada,
+    as SSPs da biblioteca (que só materializa os .spec das bases geradas); senão, o índice
+    dos .spec de SPEC_DIR.
+
+    Returns:
+        list: Um dict por SSP
+    """
+    if USE_LIBRARY_STORE and os.path.exists(_caminhos_biblioteca(LIBRARY_DIR)[2]):
+        return carregar_biblioteca(LIBRARY_DIR)[2]
+    if not os.path.isdir(SPEC_DIR):
+        raise FileNotFoundError(
+            f"Nem a biblioteca ({LIBRARY_DIR}) nem os .spec ({SPEC_DIR}) existem: "
+            "rode 'python cli.py miles' primeiro."
+        )
+    return carregar_catalogo()
+
+
+def consultar_catalogo(
+    catalogo=None,
+    idade_min=None,
+    idade_max=None,
+    mh_min=None,
+    mh_max=None,
+    idades=None,
+    mhs=None,
+):
+    """
+    Seleciona SSPs do catálogo por faixas (inclusivas) ou listas de idade [Gyr] e [M/H].
+    Critérios None não filtram.
+
+    Returns:
+        list: Entradas do catálogo selecionadas
+    """
+    if catalogo is None:
+        catalogo = catalogo_padrao()
+
+    selecionadas = []
+    for e in catalogo:
+        if idade_min is not None and e["age_gyr"] < idade_min:
+            continue
+        if idade_max is not None and e["age_gyr"] > idade_max:
+            continue
+        if mh_min is not None and e["mh"] < mh_min:
+            continue
+        if mh_max is not None and e["mh"] > mh_max:
+            continue
+        if idades is not None and e["age_gyr"] not in idades:
+            continue
+        if mhs is not None and e["mh"] not in mhs:
+            continue
+        selecionadas.append(e)
+    return selecionadas
+
+
+def escrever_base(output_base_file, ssps):
+    """
+    Escreve um arquivo de base do STARLIGHT (Base.Miles.*) com as SSPs do catálogo.
+    """
+    base_elements = []
+    for e in ssps:
+        age_yr = e["age_gyr"] * 1e9
+        z_mass = Z_SUN * (10 ** e["mh"])
+        code = f"t{float(e['age_gyr']):.4f}_z{e['sign']}{e['z_val']}"
+
+        base_elements.append(
+            {
+                "file": e["file"],
+                "age": f"{age_yr:.5e}",
+                "z": f"{z_mass:.5f}",
+                "code": code[:15],
+                "mstar": f"{e['mstar']:.4f}",
+                "yav": "0",
+                "afe": "0.0000",
+            }
+        )
+
+    with open(output_base_file, "w") as f:
+        f.write(str(len(base_elements)) + "            [N_base]\n")
+        for e in base_elements:
+            line = f"{e['file']:45s} {e['age']:14s} {e['z']:11s} {e['code']:15s} {e['mstar']:10s} {e['yav']:5s} {e['afe']:s}\n"
+            f.write(line)
+        f.write(
+            "# spec-file                                   age [yr]       Z           code            Mstar      YAV?  a/Fe\n"
+        )
+        f.write(
+            "# Base MILES filtrada gerada no arquivo Base.Miles.Total. Idades e metallicidades selecionadas:\n"
+        )
+
+
+def gerar_base(output_base_name, catalogo=None, **filtros):
+    """
+    Gera uma base filtrada sem interação, a partir do catálogo.
+
+    Args:
+        output_base_name [str]: Nome do arquivo de base (ex: Base.Miles.X), criado em OUTPUT_BASE_DIR
+        catalogo [list]: Catálogo a consultar (padrão: catalogo_padrao())
+        **filtros: Critérios de consultar_catalogo (idade_min, idade_max, mh_min, mh_max, idades, mhs)
+
+    Returns:
+        str: Caminho do arquivo de base gerado
+    """
+    ssps = consultar_catalogo(catalogo, **filtros)
+    os.makedirs(OUTPUT_BASE_DIR, exist_ok=True)
+    output_base_file = os.path.join(OUTPUT_BASE_DIR, output_base_name)
+    escrever_base(output_base_file, ssps)
+    print(f"  [BASE] {output_base_file}: {len(ssps)} SSPs")
+    return output_base_file
+
+
+def ler_base(base_file):
+    """
+    Lista os arquivos .spec declarados num arquivo de base do STARLIGHT.
+    """
+    with open(base_file, "r") as f:
+        n_base = int(f.readline().split()[0])
+        return [f.readline().split()[0] for _ in range(n_base)]
+
+
+def preparar_base_recortada(
+    base_file,
+    base_dir,
+    olsyn_ini,
+    olsyn_fin,
+    delta_lambda,
+    lambdas_extras=(),
+    margem=MARGEM_BASE,
+    cache_dir=BASE_CACHE_DIR,
+):
+    """
+    Cria (ou reaproveita) um diretório de base com os espectros da base já recortados e
+    reamostrados para a janela do ajuste, no mesmo grid que o STARLIGHT usa (olsyn_ini + k * delta_lambda).
+    O diretório é identificado pela base, pelo base_dir e pelo grid recortado (início, fim e
+    passo, que dependem também de lambdas_extras e da margem); espectros já gerados e mais
+    novos que o original não são refeitos.
+
+    Args:
+        base_file [str]: Arquivo de base (ex: Base.Miles.MaxCut)
+        base_dir [str]: Diretório com os .spec originais
+        olsyn_ini, olsyn_fin [float]: Janela do ajuste
+        delta_lambda [float]: Passo do ajuste (Odlsyn)
+        lambdas_extras [tuple]: Lambdas que também precisam ser cobertos (ex: janela de S/N, l_norm)
+        margem [float]: Angstroms mantidos em cada lado da janela
+        cache_dir [str]: Diretório raiz das bases derivadas
+
+    Returns:
+        str: Caminho do diretório de base derivado
+    """
+    ini = min([olsyn_ini, *lambdas_extras]) - margem
+    fin = max([olsyn_fin, *lambdas_extras]) + margem
+    # Alinha ao grid do ajuste para que a reamostragem do STARLIGHT não interpole de novo
+    ini = olsyn_ini - np.ceil((olsyn_ini - ini) / delta_lambda) * delta_lambda
+    grid = np.arange(ini, fin + delta_lambda / 2, delta_lambda)
+
+    # base_dir entra por um hash curto: .spec de mesmo nome em base_dirs diferentes não
+    # podem compartilhar o recorte
+    origem_hash = hashlib.sha1(os.path.abspath(base_dir).encode()).hexdigest()[:8]
+    nome = (
+        f"{os.path.basename(base_file)}_{origem_hash}_"
+        f"{grid[0]:.10g}_{grid[-1]:.10g}_{delta_lambda:.10g}"
+    )
+    destino = os.path.join(cache_dir, nome)
+    os.makedirs(destino, exist_ok=True)
+
+    specs = ler_base(base_file)
+    if USE_LIBRARY_STORE and os.path.exists(_caminhos_biblioteca(LIBRARY_DIR)[2]):
+        materializar_specs(specs, base_dir)
+
+    gerados = 0
+    for spec in specs:
+        origem = os.path.join(base_dir, spec)
+        saida = os.path.join(destino, spec)
+        if not os.path.exists(origem):
+            print(f"  [ERRO] Espectro da base não encontrado: {origem}")
+            continue
+        if os.path.exists(saida) and os.path.getmtime(saida) >= os.path.getmtime(origem):
+            continue
+        dados = spec_io.ler_tabela(origem)
+        # Sem extrapolação: o recorte nunca passa da cobertura do espectro original
+        dentro = (grid >= dados[0, 0]) & (grid <= dados[-1, 0])
+        fluxo = np.interp(grid[dentro], dados[:, 0], dados[:, 1])
+        spec_io.escrever_spec(saida, grid[dentro], fluxo)
+        gerados += 1
+
+    if gerados:
+        print(f"  [BASE RECORTADA] {gerados} espectros gerados em {destino}")
+    return destino
+
+
+def _caminhos_biblioteca(library_dir):
+    return (
+        os.path.join(library_dir, "fluxos.npy"),
+        os.path.join(library_dir, "lambdas.npy"),
+        os.path.join(library_dir, "metadados.json"),
+    )
+
+
+def construir_biblioteca(fits_path=FITS_PATH, mass_file=MASS_FILE, library_dir=LIBRARY_DIR):
+    """
+    Consolida todos os FITS da biblioteca num único array (N_ssp, N_lambda) float64 que pode
+    ser aberto com memory mapping, mais o eixo de lambda comum e uma tabela de metadados
+    (mesmos campos do catálogo). Só é refeita se o diretório FITS ou o arquivo de massas mudaram.
+
+    Returns:
+        str: Diretório da biblioteca
+    """
+    fluxos_file, lambdas_file, meta_file = _caminhos_biblioteca(library_dir)
+    assinatura = _assinatura(fits_path, mass_file)
+    if os.path.exists(meta_file) and os.path.exists(fluxos_file):
+        with open(meta_file, "r") as f:
+            if json.load(f).get("assinatura") == assinatura:
+                return library_dir
+
+    print("Consolidando a biblioteca SSP")
+    mass_map = load_mass_map(mass_file) if os.path.exists(mass_file) else {}
+    fits_files = sorted(
+        f for f in os.listdir(fits_path) if f.endswith(".fits") and pattern.search(f)
+    )
+
+    os.makedirs(library_dir, exist_ok=True)
+    lambdas = None
+    fluxos = None
+    tmp_fluxos = fluxos_file + ".tmp.npy"
+    ssps = []
+    try:
+        for i, filename in enumerate(fits_files):
+            l_ssp, flux = get_data_from_fits(os.path.join(fits_path, filename))
+            if lambdas is None:
+                lambdas = np.asarray(l_ssp, dtype=float)
+                fluxos = np.lib.format.open_memmap(
+                    tmp_fluxos, mode="w+", dtype=float, shape=(len(fits_files), len(lambdas))
+                )
+            elif len(l_ssp) != len(lambdas) or not np.array_equal(l_ssp, lambdas):
+                raise ValueError(
+                    f"Eixo de lambda diferente do restante da biblioteca: {filename}"
+                )
+            fluxos[i] = flux
+
+            sign, z_val, age_gyr_str = pattern.search(filename).groups()
+            mh = float(z_val) * (-1 if sign == "m" else 1)
+            age_gyr = float(age_gyr_str)
+            ssps.append(
+                {
+                    "file": filename.replace(".fits", ".spec"),
+                    "sign": sign,
+                    "z_val": z_val,
+                    "mh": mh,
+                    "age_gyr": age_gyr,
+                    "lambda_min": float(lambdas[0]),
+                    "lambda_max": float(lambdas[-1]),
+                    "mstar": mass_map.get((round(mh, 2), round(age_gyr, 4)), 1.0000),
+                }
+            )
+
+        if fluxos is None:
+            raise FileNotFoundError(f"Nenhum FITS da biblioteca em {fits_path}")
+        fluxos.flush()
+        del fluxos
+        os.replace(tmp_fluxos, fluxos_file)
+    except Exception:
+        # Não deixa o array parcial no disco
+        fluxos = None
+        if os.path.exists(tmp_fluxos):
+            os.remove(tmp_fluxos)
+        raise
+    np.save(lambdas_file + ".tmp.npy", lambdas)
+    os.replace(lambdas_file + ".tmp.npy", lambdas_file)
+    with open(meta_file + ".tmp", "w") as f:
+        json.dump({"assinatura": assinatura, "ssps": ssps}, f)
+    os.replace(meta_file + ".tmp", meta_file)
+    print(f"  [BIBLIOTECA] {len(ssps)} SSPs x {len(lambdas)} pixels em {library_dir}")
+    return library_dir
+
+
+def carregar_biblioteca(library_dir=LIBRARY_DIR):
+    """
+    Abre a biblioteca consolidada com memory mapping (nada é lido do disco até ser usado).
+
+    Returns:
+        tuple: (lambdas, fluxos (N_ssp, N_lambda) somente leitura, lista de metadados por SSP)
+    """
+    fluxos_file, lambdas_file, meta_file = _caminhos_biblioteca(library_dir)
+    with open(meta_file, "r") as f:
+        ssps = json.load(f)["ssps"]
+    return np.load(lambdas_file), np.load(fluxos_file, mmap_mode="r"), ssps
+
+
+def materializar_specs(spec_files, spec_dir=SPEC_DIR, library_dir=LIBRARY_DIR):
+    """
+    Escreve em spec_dir os .spec pedidos que ainda não existem ou são mais velhos que a
+    biblioteca (refeita a partir de FITS alterados), a partir da biblioteca.
+    O conteúdo é idêntico ao de convert_fits_to_spec.
+
+    Returns:
+        int: Número de arquivos gerados
+    """
+    mtime_biblioteca = os.path.getmtime(_caminhos_biblioteca(library_dir)[0])
+    faltando = [
+        f
+        for f in spec_files
+        if not os.path.exists(os.path.join(spec_dir, f))
+        or os.path.getmtime(os.path.join(spec_dir, f)) < mtime_biblioteca
+    ]
+    if not faltando:
+        return 0
+
+    lambdas, fluxos, ssps = carregar_biblioteca(library_dir)
+    indice = {e["file"]: i for i, e in enumerate(ssps)}
+    os.makedirs(spec_dir, exist_ok=True)
+    gerados = 0
+    for spec in faltando:
+        if spec not in indice:
+            print(f"  [ERRO] SSP fora da biblioteca: {spec}")
+            continue
+        spec_io.escrever_spec(
+            os.path.join(spec_dir, spec), lambdas, fluxos[indice[spec]], sidecar=SIDECAR_NPY
+        )
+        gerados += 1
+    return gerados
+
+
+def select_ages_and_metallicities(catalogo=None):
+    if catalogo is None:
+        catalogo = catalogo_padrao()
+    ages_list = sorted({e["age_gyr"] for e in catalogo})
+    mh_list = sorted({e["mh"] for e in catalogo})
 
     print("\nIdades disponíveis (Gyr):")
     for i, age in enumerate(ages_list):
@@ -130,84 +602,64 @@ def select_ages_and_metallicities():
     return selected_ages_gyr, selected_mh_list
 
 
-def generate_filtered_base(spec_dir, mass_file):
+def generate_filtered_base(spec_dir, mass_file, catalogo=None):
     output_base_name = input(
         f"\nDigite o nome do arquivo de saída para a base filtrada (ex: Base.Miles.X): "
     )
 
     output_base_file = os.path.join(OUTPUT_BASE_DIR, output_base_name)
 
-    selected_ages_list, selected_mh_list = select_ages_and_metallicities()
-    mass_map = load_mass_map(mass_file)
-
-    spec_files = []
-    for f in os.listdir(spec_dir):
-        spec_files.append(f)
-
-    base_elements = []
-
-    for filename in spec_files:
-        match = pattern.search(filename)
-        if match:
-            sign, z_val, age_gyr_str = match.groups()
-            mh_val = float(z_val) * (-1 if sign == "m" else 1)
-            age_gyr = float(age_gyr_str)
-
-            # Filtro
-            if mh_val not in selected_mh_list:
-                continue
-
-            if age_gyr not in selected_ages_list:
-                continue
-
-            mstar = mass_map.get((round(mh_val, 2), round(age_gyr, 4)), 1.0000)
-            age_yr = age_gyr * 1e9
-            z_mass = Z_SUN * (10**mh_val)
-            code = f"t{float(age_gyr):.4f}_z{sign}{z_val}"
+    if catalogo is None:
+        catalogo = carregar_catalogo(spec_dir, mass_file)
+    selected_ages_list, selected_mh_list = select_ages_and_metallicities(catalogo)
 
-            base_elements.append(
-                {
-                    "file": filename,
-                    "age": f"{age_yr:.5e}",
-                    "z": f"{z_mass:.5f}",
-                    "code": code[:15],
-                    "mstar": f"{mstar:.4f}",
-                    "yav": "0",
-                    "afe": "0.0000",
-                }
-            )
-
-    with open(output_base_file, "w") as f:
-        f.write(str(len(base_elements)) + "            [N_base]\n")
-        for e in base_elements:
-            line = f"{e['file']:45s} {e['age']:14s} {e['z']:11s} {e['code']:15s} {e['mstar']:10s} {e['yav']:5s} {e['afe']:s}\n"
-            f.write(line)
-        f.write(
-            "# spec-file                                   age [yr]       Z           code            Mstar      YAV?  a/Fe\n"
-        )
-        f.write(
-            "# Base MILES filtrada gerada no arquivo Base.Miles.Total. Idades e metallicidades selecionadas:\n"
-        )
+    ssps = consultar_catalogo(catalogo, idades=selected_ages_list, mhs=selected_mh_list)
+    escrever_base(output_base_file, ssps)
     return output_base_name
 
 
-def run():
-    print("\n--- Gerador de Base MILES ---")
-    convert_fits_to_spec(FITS_PATH, SPEC_DIR)
-    base_name = generate_filtered_base(SPEC_DIR, MASS_FILE)
-    
-    # Criar link simbólico para a pasta atual (STARLIGHT raiz)
+def criar_link(base_name):
+    """
+    Cria o link simbólico da base na pasta atual (STARLIGHT raiz).
+    """
     link_dir = PROJECT_ROOT
     os.makedirs(link_dir, exist_ok=True)
-    
+
     base_original_path = os.path.join(OUTPUT_BASE_DIR, base_name)
     link_path = os.path.join(link_dir, base_name)
-    
+
     if os.path.exists(link_path) or os.path.islink(link_path):
         os.remove(link_path)
     os.symlink(base_original_path, link_path)
     print(f"  [LINK CRIADO] {link_path} -> {base_original_path}")
-    
+
+
+def run(base_name=None, **filtros):
+    """
+    Converte a biblioteca e gera uma base. Sem base_name, pergunta nome, idades e
+    metalicidades; com base_name, usa os filtros de consultar_catalogo sem interação.
+    Com USE_LIBRARY_STORE, consolida a biblioteca e só gera os .spec da base escolhida.
+    """
+    print("\n--- Gerador de Base MILES ---")
+    catalogo = None
+    if USE_LIBRARY_STORE:
+        construir_biblioteca(FITS_PATH, MASS_FILE)
+        catalogo = carregar_biblioteca()[2]
+    else:
+        convert_fits_to_spec(FITS_PATH, SPEC_DIR)
+
+    if base_name is None:
+        base_name = generate_filtered_base(SPEC_DIR, MASS_FILE, catalogo)
+    else:
+        gerar_base(base_name, catalogo, **filtros)
+
+    if USE_LIBRARY_STORE:
+        specs = ler_base(os.path.join(OUTPUT_BASE_DIR, base_name))
+        gerados = materializar_specs(specs, SPEC_DIR)
+        print(f"  [SPEC] {gerados} arquivos .spec gerados a partir da biblioteca.")
+
+    criar_link(base_name)
+
     return base_name
 
 
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+
+# Substituto do StarlightChains_v04.exe para perfilar a pipeline sem o executável real.
+#
+# Lê o grid do stdin exatamente como runs.escrever_grid o escreve e, para cada ajuste, grava um
+# .out sintaticamente válido (chaves do header, tabela de populações com as componentes da base e
+# bloco "Synthetic spectrum") depois de um tempo de execução simulado. Os valores são sorteados
+# de forma determinística a partir da semente do grid e do nome do alvo.
+#
+# Variáveis de ambiente:
+#     MOCK_STARLIGHT_CARGA    Tempo de carga da base por processo [s] (padrão 0)
+#     MOCK_STARLIGHT_AJUSTE   Tempo de um ajuste com MOCK_PIXELS_REF pixels válidos [s]
+#                             (padrão 0), proporcional aos pixels válidos e dobrado com FIT
+#     MOCK_STARLIGHT_FALHA    Probabilidade de um ajuste abortar com erro de runtime (padrão 0)
+#
+# Uso: config.STARLIGHT_EXE = caminho deste arquivo (precisa de permissão de execução).
+
+N_LINHAS_HEADER_GRID = 15
+MOCK_PIXELS_REF = 3000
+
+
+def ler_grid(texto):
+    linhas = texto.splitlines()
+    campos = [l.split()[0] for l in linhas[:N_LINHAS_HEADER_GRID]]
+    header = {
+        "n": int(campos[0]),
+        "base_dir": campos[1],
+        "obs_dir": campos[2],
+        "out_dir": campos[4],
+        "seed": int(campos[5]),
+        "olsyn_ini": float(campos[8]),
+        "olsyn_fin": float(campos[9]),
+        "odlsyn": float(campos[10]),
+        "kine": campos[12],
+        "is_flag": int(campos[14]),
+    }
+    ajustes = [l.split() for l in linhas[N_LINHAS_HEADER_GRID:] if l.strip()]
+    return header, ajustes[: header["n"]]
+
+
+def ler_base(base_file):
+    """
+    Returns:
+        list: (arquivo .spec, idade [anos], Z) de cada componente
+    """
+    with open(base_file, "r") as f:
+        n_base = int(f.readline().split()[0])
+        componentes = []
+        for _ in range(n_base):
+            cols = f.readline().split()
+            componentes.append((cols[0], float(cols[1]), float(cols[2])))
+    return componentes
+
+
+def sintetizar(header, entrada, componentes, rng):
+    """
+    Simula o resultado de um ajuste a partir do espectro de entrada.
+
+    Returns:
+        dict: Grandezas do header, tabela de populações e espectro sintético
+    """
+    dados = np.loadtxt(entrada, ndmin=2)
+    passo = header["odlsyn"]
+    l_syn = np.arange(header["olsyn_ini"], header["olsyn_fin"] + passo / 2, passo)
+    f_obs = np.interp(l_syn, dados[:, 0], dados[:, 1])
+    validos = (l_syn >= dados[0, 0]) & (l_syn <= dados[-1, 0])
+    if header["is_flag"] and dados.shape[1] > 3:
+        flag = np.interp(l_syn, dados[:, 0], dados[:, 3])
+        validos &= flag == 0
+
+    n0 = int(validos.sum())
+    nclip = int(rng.binomial(n0, 0.01)) if n0 else 0
+    wei = np.where(validos, 1.0, 0.0)
+    if nclip:
+        wei[rng.choice(np.flatnonzero(validos), nclip, replace=False)] = -1.0
+    f_syn = f_obs * (1 + rng.normal(0, 0.02, len(l_syn)))
+
+    n_base = len(componentes)
+    return {
+        "chi2": rng.uniform(0.5, 2.0),
+        "adev": rng.uniform(1.0, 6.0),
+        "av": rng.uniform(0.0, 1.0),
+        "v0": rng.normal(0.0, 10.0),
+        "vd": rng.uniform(50.0, 250.0),
+        "n0": n0,
+        "nl": n0 - nclip,
+        "nclip": nclip,
+        "x_j": rng.dirichlet(np.ones(n_base)) * 100,
+        "m_ini": rng.dirichlet(np.ones(n_base)) * 100,
+        "espectro": (l_syn, f_obs, f_syn, wei),
+    }
+
+
+def escrever_out(path, base_name, componentes, r):
+    linhas = [
+        "## Synthesis Results - Best model ##",
+        "",
+        f"{r['chi2']:14.5f}     [chi2/Nl_eff]",
+        f"{r['adev']:14.5f}     [adev (%)]",
+        "",
+        f"{r['av']:14.4f}     [AV_min  (mag)]",
+        f"{r['v0']:14.4f}     [v0_min  (km/s)]",
+        f"{r['vd']:14.4f}     [vd_min  (km/s)]",
+        "",
+        f"{r['n0']:14d}     [NOl_eff]",
+        f"{r['nl']:14d}     [Nl_eff]",
+        f"{r['nclip']:14d}     [Ntot_cliped & clip_method]",
+        f"{base_name:>14s}     [arq_base]",
+        "",
+        "# j     x_j(%)      Mini_j(%)     Mcor_j(%)     age_j(yr)     Z_j      component_j",
+    ]
+    for j, (spec, idade, z) in enumerate(componentes):
+        linhas.append(
+            f"{j + 1:3d} {r['x_j'][j]:10.4f} {r['m_ini'][j]:12.4e} {r['m_ini'][j]:12.4e} "
+            f"{idade:12.4e} {z:8.5f}   {spec}"
+        )
+    linhas += ["", "## Synthetic spectrum (Best Model) ##l_obs f_obs f_syn wei"]
+
+    l_syn, f_obs, f_syn, wei = r["espectro"]
+    linhas.append(f"{len(l_syn)}  [Nl_obs]")
+    tabela = np.column_stack((l_syn, f_obs, f_syn, wei))
+    corpo = ("%8.2f %12.5f %12.5f %9.4f\n" * len(tabela)) % tuple(tabela.ravel().tolist())
+
+    tmp = path + ".part"
+    with open(tmp, "w") as f:
+        f.write("\n".join(linhas) + "\n")
+        f.write(corpo)
+    os.replace(tmp, path)
+
+
+def main():
+    carga = float(os.environ.get("MOCK_STARLIGHT_CARGA", 0))
+    tempo_ajuste = float(os.environ.get("MOCK_STARLIGHT_AJUSTE", 0))
+    prob_falha = float(os.environ.get("MOCK_STARLIGHT_FALHA", 0))
+
+    header, ajustes = ler_grid(sys.stdin.read())
+    time.sleep(carga)
+
+    bases = {}
+    for campos in ajustes:
+        entrada, base_name, saida = campos[0], campos[2], campos[-1]
+        if base_name not in bases:
+            bases[base_name] = ler_base(base_name)
+        rng = np.random.default_rng([header["seed"], zlib.crc32(entrada.encode())])
+
+        # Falhas não são determinísticas: uma nova tentativa do scheduler pode passar
+        if np.random.random() < prob_falha:
+            print(f"forrtl: severe (24): end-of-file during read, unit 1, file {entrada}")
+            sys.exit(1)
+
+        inicio = time.monotonic()
+        r = sintetizar(header, os.path.join(header["obs_dir"], entrada), bases[base_name], rng)
+        fator = 2.0 if header["kine"] == "FIT" else 1.0
+        restante = tempo_ajuste * fator * r["n0"] / MOCK_PIXELS_REF - (time.monotonic() - inicio)
+        if restante > 0:
+            time.sleep(restante)
+
+        os.makedirs(header["out_dir"], exist_ok=True)
+        escrever_out(os.path.join(header["out_dir"], saida), base_name, bases[base_name], r)
+        print(f" ... {entrada} -> {saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import glob
+import os
+import shutil
+import zlib
+
+import numpy as np
+
+import config
+import runs
+import scheduler
+import spec_io
+
+MC_DIR = os.path.join(config.PIPELINE_DIR, "montecarlo")
+
+# As realizações só vivem até o ajuste: precisão de float32 basta e o arquivo fica ~30% menor
+# (medido: 29% num espectro de 3600 pixels)
+FMT_IN_MC = "%.1f %.8e %.8e %d\n"
+SUFIXO = "_mc"
+
+
+def nome_realizacao(alvo, k):
+    return f"{alvo}{SUFIXO}{k + 1:04d}"
+
+
+def alvo_da_realizacao(nome):
+    return nome.rsplit(SUFIXO, 1)[0]
+
+
+def gerador_realizacao(alvo, k, semente=config.MC_SEMENTE):
+    """
+    Gerador de números aleatórios da realização k de um alvo, derivado da semente, do nome e
+    de k: cada realização é reprodutível e não depende da ordem dos alvos, de quais chunks são
+    gerados primeiro nem do número total de realizações.
+    """
+    return np.random.default_rng([semente, zlib.crc32(alvo.encode()), k])
+
+
+def perturbar(fluxo, erro, flag, ruido):
+    """
+    Aplica o ruído de todas as realizações pedidas numa única operação vetorizada:
+    fluxo + erro * N(0, 1), só nos pixels bons (flag 0 e erro finito).
+
+    Args:
+        fluxo, erro, flag [np.array]: Colunas do .in
+        ruido [np.array]: Sorteios N(0, 1), um por realização (n_realizacoes x n_pix)
+
+    Returns:
+        np.array: Fluxos perturbados (n_realizacoes x n_pix)
+    """
+    bons = (flag == 0) & np.isfinite(erro)
+    return fluxo + ruido * np.where(bons, erro, 0.0)
+
+
+def gerar_realizacoes(alvo, indices, destino, semente=config.MC_SEMENTE):
+    """
+    Escreve as realizações pedidas de um alvo em destino/{alvo}_mcNNNN.in. Só as linhas
+    pedidas são sorteadas, cada uma do gerador da sua realização (gerador_realizacao).
+    """
+    dados = spec_io.ler_tabela(os.path.join(config.INPUTS_DIR, f"{alvo}.in"))
+    l_ambda, fluxo, erro, flag = dados.T
+    ruido = np.empty((len(indices), len(fluxo)))
+    for linha, k in enumerate(indices):
+        gerador_realizacao(alvo, k, semente).standard_normal(out=ruido[linha])
+    fluxos = perturbar(fluxo, erro, flag, ruido)
+    for linha, k in enumerate(indices):
+        spec_io.escrever_tabela(
+            os.path.join(destino, f"{nome_realizacao(alvo, k)}.in"),
+            (l_ambda, fluxos[linha], erro, flag),
+            FMT_IN_MC,
+        )
+
+
+def preparar_job(job):
+    """
+    Gera, na thread do job, só as realizações do seu grid (o disco nunca guarda todas).
+    """
+    por_alvo = {}
+    for nome in job["alvos"]:
+        k = int(nome.rsplit(SUFIXO, 1)[1]) - 1
+        por_alvo.setdefault(alvo_da_realizacao(nome), []).append(k)
+    for alvo, indices in por_alvo.items():
+        gerar_realizacoes(alvo, indices, job["inputs_dir"], job["semente"])
+
+
+def reduzir(df, percentis=config.MC_PERCENTIS):
+    """
+    Reduz a tabela por realização (colher_resultados) a uma linha por alvo, com o número
+    de realizações válidas e os percentis de cada grandeza.
+
+    Returns:
+        pandas.DataFrame: Colunas Target, N, "<grandeza> p<percentil>"...
+    """
+    import pandas as pd
+
+    df = df.assign(Target=df["Target"].map(alvo_da_realizacao))
+    grupos = df.groupby("Target", sort=True)
+    colunas = [c for c in runs.COLUNAS_SUMMARY if c != "Target"]
+
+    resumo = pd.DataFrame({"N": grupos.size()})
+    for col in colunas:
+        for p in percentis:
+            resumo[f"{col} p{p}"] = grupos[col].quantile(p / 100)
+    return resumo.reset_index()
+
+
+def main(selected_targets=None, n_realizacoes=None, semente=None, retomar=False):
+    """
+    Modo Monte Carlo: reajusta cada alvo em n_realizacoes espectros com o fluxo perturbado
+    pelo erro do .in e resume as distribuições em montecarlo/summary.csv (uma linha por alvo).
+    A tabela completa, uma linha por realização, fica em montecarlo/realizacoes.csv.
+
+    Args:
+        selected_targets [list]: Alvos (None = seleção interativa)
+        n_realizacoes [int]: Realizações por alvo (padrão: config.MC_REALIZACOES)
+        semente [int]: Semente base (padrão: config.MC_SEMENTE)
+        retomar [bool]: Mantém os .out completos e atualizados
+    """
+    n_realizacoes = n_realizacoes or config.MC_REALIZACOES
+    semente = config.MC_SEMENTE if semente is None else semente
+
+    work_dirs = ["inputs", "grids", "logs"] if retomar else ["inputs", "grids", "logs", "outputs"]
+    for d in work_dirs:
+        full_path = os.path.join(MC_DIR, d)
+        if os.path.exists(full_path):
+            shutil.rmtree(full_path)
+        os.makedirs(full_path)
+    inputs_dir = os.path.join(MC_DIR, "inputs")
+    out_dir = os.path.join(MC_DIR, "outputs")
+    os.makedirs(out_dir, exist_ok=True)
+
+    if selected_targets is None:
+        selected_targets = runs.select_targets(config.INPUTS_DIR)
+
+    s = config.STARLIGHT_PARAMS
+
+    # A impressão de cada realização é a do alvo original + semente e índice; o .in do alvo
+    # é lido e hasheado uma só vez para todas as realizações
+    comum = runs.impressao_base(s)
+    impressoes = {}
+    for alvo in selected_targets:
+        entrada = runs._hash_arquivo(os.path.join(config.INPUTS_DIR, f"{alvo}.in"))
+        for k in range(n_realizacoes):
+            dados = dict(comum, mc=[semente, k])
+            impressoes[nome_realizacao(alvo, k)] = runs.impressao_digital(
+                alvo, dados, config.INPUTS_DIR, entrada=entrada
+            )
+    nomes = list(impressoes)
+    pendentes = [
+        n for n in nomes if not (retomar and runs.ajuste_atualizado(out_dir, n, impressoes[n]))
+    ]
+    for nome in pendentes:
+        for ext in (".out", ".fp"):
+            if os.path.exists(os.path.join(out_dir, nome + ext)):
+                os.remove(os.path.join(out_dir, nome + ext))
+
+    max_workers = runs.numero_workers()
+    chunk_size = config.CHUNK_SIZE or scheduler.escolher_chunk_size(len(pendentes), max_workers)
+
+    # Uma realização custa o mesmo que o ajuste do alvo original
+    custos = None
+    if config.ORDENAR_JOBS:
+        custos_alvos, _ = scheduler.prever_custos(
+            selected_targets, s, scheduler.carregar_historico()
+        )
+        custos = {n: custos_alvos[alvo_da_realizacao(n)] for n in pendentes}
+
+    jobs = runs.montar_jobs(
+        pendentes,
+        s,
+        runs.preparar_base_dir(s),
+        chunk_size,
+        os.path.join(MC_DIR, "grids"),
+        os.path.join(MC_DIR, "logs"),
+        out_dir,
+        inputs_dir=inputs_dir,
+        custos=custos,
+    )
+    for job in jobs:
+        job.update(
+            preparar=preparar_job,
+            inputs_dir=inputs_dir,
+            semente=semente,
+        )
+
+    print(
+        f"  > Monte Carlo: {len(selected_targets)} alvos x {n_realizacoes} realizações "
+        f"({len(pendentes)} ajustes a rodar)."
+    )
+    print(f"  > {len(jobs)} grids com até {chunk_size} ajustes cada, {max_workers} threads.\n")
+
+    def registrar(resultado):
+        for nome in resultado["alvos"]:
+            if nome not in resultado["faltando"]:
+                runs.salvar_impressao(out_dir, nome, impressoes[nome])
+            if not config.MC_MANTER_ENTRADAS:
+                in_path = os.path.join(inputs_dir, f"{nome}.in")
+                if os.path.exists(in_path):
+                    os.remove(in_path)
+
+    metricas_file = os.path.join(MC_DIR, "metrics.jsonl")
+    if not retomar and os.path.exists(metricas_file):
+        os.remove(metricas_file)
+    resultados = scheduler.executar_jobs(
+        jobs, max_workers, ao_concluir=registrar, metricas=metricas_file
+    )
+
+    for r in resultados:
+        if not r["ok"]:
+            print(
+                f"  [ERRO] {os.path.basename(r['grid'])}: {r['erro']} "
+                f"(realizações sem saída: {len(r['faltando'])})"
+            )
+
+    out_paths = [
+        os.path.join(out_dir, f"{n}.out")
+        for n in nomes
+        if os.path.exists(os.path.join(out_dir, f"{n}.out"))
+    ]
+    df = runs.colher_resultados(out_paths, max_workers)
+    df = runs.juntar_metricas(df, metricas_file)
+    df.to_csv(os.path.join(MC_DIR, "realizacoes.csv"), index=False)
+
+    resumo = reduzir(df)
+    runs.escrever_summary(resumo, MC_DIR, parquet=config.SUMMARY_PARQUET)
+    if config.EXPORTAR_ACERVO:
+        import acervo
+
+        # A partição é substituída inteira: exporta todos os .out, não só os alvos desta execução
+        acervo.exportar(
+            glob.glob(os.path.join(out_dir, "*.out")), "montecarlo", n_workers=max_workers
+        )
+
+    print(f"   Resumo Monte Carlo: {os.path.join(MC_DIR, 'summary.csv')}")
+    return resumo
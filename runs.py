@@ -1,12 +1,31 @@
 import glob
+import hashlib
+import json
 import os
 import shutil
-import subprocess
 import sys
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
 
 import config
-import pandas as pd
+import scheduler
+
+COLUNAS_SUMMARY = [
+    "Target",
+    "Mean Age(by light)",
+    "Mean Z (by light)",
+    "Mean Age (by mass)",
+    "Mean Z (by mass)",
+    "A_V",
+    "chi2",
+    "adev",
+    "Clip %",
+    "n0",
+    "nl",
+    "nclip",
+]
+
+# Métricas de recursos por ajuste (scheduler), juntadas ao summary
+COLUNAS_METRICAS = ["Tempo [s]", "CPU user [s]", "CPU sys [s]", "Max RSS [MB]", "Status"]
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.join(base_dir, "Scripts"))
@@ -43,39 +62,67 @@ def select_targets(input_dir):
         return selected_targets
 
 
-def main():
+def lambdas_normalizacao(config_file):
+    """
+    Lê do arquivo de configuração do STARLIGHT os lambdas de normalização (l_norm da base e
+    a janela llow_norm/lupp_norm do espectro), que a base recortada também precisa cobrir.
 
-    work_dirs = ["grids", "outputs", "logs"]
-    for d in work_dirs:
-        full_path = os.path.join(config.PIPELINE_DIR, d)
-        if os.path.exists(full_path):
-            shutil.rmtree(full_path)
-        os.makedirs(full_path)
+    Returns:
+        tuple: Lambdas encontrados (vazio se o arquivo não existe)
+    """
+    if not os.path.exists(config_file):
+        return ()
+    lambdas = []
+    with open(config_file, "r") as f:
+        for linha in f:
+            valor, _, rotulo = linha.partition("[")
+            rotulo = rotulo.replace("]", " ").split()
+            if rotulo and rotulo[0] in ("l_norm", "llow_norm", "lupp_norm"):
+                try:
+                    lambdas.append(float(valor.split()[0]))
+                except (ValueError, IndexError):
+                    pass
+    return tuple(lambdas)
 
-    selected_targets = select_targets(config.INPUTS_DIR)
 
-    s = config.STARLIGHT_PARAMS
-    base_name = s["base"]
+def preparar_base_dir(s):
+    """
+    Retorna o base_dir do grid (relativo a PIPELINE_DIR). Com config.USE_BASE_CACHE, aponta
+    para a base já recortada e reamostrada para a janela do ajuste, gerando-a se necessário.
+    """
+    if not config.USE_BASE_CACHE:
+        return s["base_dir"]
 
-    chunks = [
-        selected_targets[i : i + config.CHUNK_SIZE]
-        for i in range(0, len(selected_targets), config.CHUNK_SIZE)
-    ]
+    import miles
 
-    rel_inputs_dir = os.path.relpath(config.INPUTS_DIR, config.PIPELINE_DIR)
+    base_dir = miles.preparar_base_recortada(
+        os.path.join(config.PIPELINE_DIR, s["base"]),
+        os.path.join(config.PIPELINE_DIR, s["base_dir"]),
+        s["olsyn_ini"],
+        s["olsyn_fin"],
+        s["delta_lambda"],
+        lambdas_extras=(
+            s["lllow_SN"],
+            s["llup_SN"],
+            *lambdas_normalizacao(os.path.join(config.PIPELINE_DIR, s["template_config"])),
+        ),
+    )
+    rel_base_dir = os.path.relpath(base_dir, config.PIPELINE_DIR)
+    return rel_base_dir + os.sep
 
-    if not rel_inputs_dir.endswith(os.sep):
-        rel_inputs_dir += os.sep
 
-    for i, chunk in enumerate(chunks):
-        grid_filename = os.path.join(config.PIPELINE_DIR, f"grids/grid_{i + 1}.in")
-        n = len(chunk)
+def escrever_grid(grid_filename, chunk, s, base_dir, obs_dir, out_dir="outputs/"):
+    """
+    Escreve um arquivo de grid do STARLIGHT (lido pelo executável via stdin).
+    Os diretórios são relativos ao diretório de trabalho do STARLIGHT.
+    """
+    n = len(chunk)
 
-        header = f"""{n}    [Number of fits to run]
-{s["base_dir"]}    [base_dir]
-{rel_inputs_dir}    [obs_dir]
+    header = f"""{n}    [Number of fits to run]
+{base_dir}    [base_dir]
+{obs_dir}    [obs_dir]
 ./             [mask_dir]
-outputs/             [out_dir]
+{out_dir}             [out_dir]
 {s["seed"]}      [random seed]
 {s["lllow_SN"]}         [llow_SN] lower-lambda of S/N window
 {s["llup_SN"]}         [lupp_SN] upper-lambda of S/N window
@@ -87,64 +134,447 @@ outputs/             [out_dir]
 {s["is_err"]}              [IsErrSpecAvailable] 1/0 = Yes/No
 {s["is_flag"]}              [IsFlagSpecAvailable] 1/0 = Yes/No
 """
-        with open(grid_filename, "w") as f:
-            f.write(header)
-            for infile in chunk:
-                # Formato do grid: spectro.in config_file base_file mask extinction v0 vd spectro.out
-                line = f"{infile}.in   {s['template_config']}   {base_name}   {s['mask']}   {s['extinction_law']}   {s['v0']}   {s['vd']}   {infile}.out\n"
-                f.write(line)
-
-    # Paralelização: roda os grids gerados usando subprocess e ThreadPoolExecutor
-    grids = sorted(glob.glob(os.path.join(config.PIPELINE_DIR, "grids/grid_*.in")))
-
-    def executar_starlight(i, grid_path):
-        log_file = os.path.join(config.PIPELINE_DIR, "logs", f"grid_{i + 1}.log")
-        cmd = f"{config.STARLIGHT_EXE} < {grid_path} > {log_file} 2>&1"
-        subprocess.run(cmd, shell=True, cwd=config.PIPELINE_DIR)
-        print(f"  [CONCLUÍDO] {os.path.basename(grid_path)}")
+    with open(grid_filename, "w") as f:
+        f.write(header)
+        for infile in chunk:
+            # Formato do grid: spectro.in config_file base_file mask extinction v0 vd spectro.out
+            line = f"{infile}.in   {s['template_config']}   {s['base']}   {s['mask']}   {s['extinction_law']}   {s['v0']}   {s['vd']}   {infile}.out\n"
+            f.write(line)
+
+
+def _hash_arquivo(path):
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for bloco in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloco)
+    except FileNotFoundError:
+        return None
+    return h.hexdigest()
+
+
+def impressao_base(s):
+    """
+    Parte da impressão digital comum a todos os alvos: STARLIGHT_PARAMS e o conteúdo do
+    arquivo de base, da máscara e do arquivo de configuração.
+    """
+    return {
+        "params": s,
+        "base": _hash_arquivo(os.path.join(config.PIPELINE_DIR, s["base"])),
+        "mask": _hash_arquivo(os.path.join(config.PIPELINE_DIR, s["mask"])),
+        "config": _hash_arquivo(os.path.join(config.PIPELINE_DIR, s["template_config"])),
+    }
+
+
+def impressao_digital(alvo, comum, inputs_dir, entrada=None):
+    """
+    Hash que identifica um ajuste: arquivo de entrada + base + parâmetros (impressao_base).
+    entrada, se dado, é o hash já calculado de {alvo}.in (evita reler o arquivo).
+    """
+    if entrada is None:
+        entrada = _hash_arquivo(os.path.join(inputs_dir, f"{alvo}.in"))
+    dados = dict(comum, entrada=entrada)
+    return hashlib.sha256(json.dumps(dados, sort_keys=True).encode()).hexdigest()
+
+
+def salvar_impressao(out_dir, alvo, impressao):
+    """
+    Grava {alvo}.fp ao lado do .out (escrita atômica).
+    """
+    path = os.path.join(out_dir, f"{alvo}.fp")
+    with open(path + ".tmp", "w") as f:
+        f.write(impressao)
+    os.replace(path + ".tmp", path)
+
+
+def ajuste_atualizado(out_dir, alvo, impressao):
+    """
+    True se {alvo}.out está completo e foi gerado com a mesma impressão digital.
+    """
+    fp_path = os.path.join(out_dir, f"{alvo}.fp")
+    if not os.path.exists(fp_path):
+        return False
+    with open(fp_path, "r") as f:
+        if f.read().strip() != impressao:
+            return False
+    return scheduler.saida_valida(os.path.join(out_dir, f"{alvo}.out"))
+
+
+def alvos_pendentes(alvos, s, out_dir, retomar, impressoes):
+    """
+    Calcula a impressão digital de cada alvo (preenchendo impressoes) e retorna os que
+    precisam rodar: todos, ou só os faltantes/desatualizados em modo retomar. Saídas antigas
+    dos alvos pendentes são apagadas para não passarem por válidas.
+    """
+    comum = impressao_base(s)
+    for alvo in alvos:
+        impressoes[alvo] = impressao_digital(alvo, comum, config.INPUTS_DIR)
+
+    pendentes = list(alvos)
+    if retomar:
+        pendentes = [a for a in alvos if not ajuste_atualizado(out_dir, a, impressoes[a])]
+    for alvo in pendentes:
+        for ext in (".out", ".fp"):
+            if os.path.exists(os.path.join(out_dir, alvo + ext)):
+                os.remove(os.path.join(out_dir, alvo + ext))
+    return pendentes
+
+
+def montar_jobs(
+    alvos,
+    s,
+    rel_base_dir,
+    chunk_size,
+    grids_dir,
+    logs_dir,
+    out_dir,
+    inputs_dir=None,
+    custos=None,
+):
+    """
+    Divide os alvos em chunks, escreve um grid por chunk e retorna os jobs do scheduler.
+
+    Args:
+        alvos [list]: Alvos a rodar
+        s [dict]: Parâmetros do STARLIGHT (formato de config.STARLIGHT_PARAMS)
+        rel_base_dir [str]: base_dir do grid, relativo a PIPELINE_DIR (preparar_base_dir)
+        chunk_size [int]: Ajustes por grid
+        grids_dir, logs_dir, out_dir [str]: Diretórios (absolutos) de grids, logs e saídas
+        inputs_dir [str]: Diretório dos .in (padrão: config.INPUTS_DIR)
+        custos [dict]: Tempo previsto de cada alvo (scheduler.prever_custos). Se dado, os
+            chunks são empacotados com carga equilibrada e os jobs saem do mais caro ao
+            mais barato; senão, os alvos são divididos na ordem dada
+
+    Returns:
+        list: Jobs {'grid', 'log', 'alvos', 'out_dir', 'custo'}
+    """
+    rel_inputs_dir = os.path.relpath(inputs_dir or config.INPUTS_DIR, config.PIPELINE_DIR)
+    rel_out_dir = os.path.relpath(out_dir, config.PIPELINE_DIR)
+    if not rel_inputs_dir.endswith(os.sep):
+        rel_inputs_dir += os.sep
+    if not rel_out_dir.endswith(os.sep):
+        rel_out_dir += os.sep
+
+    if custos is not None:
+        chunks = scheduler.empacotar(alvos, custos, chunk_size)
+    else:
+        chunks = [alvos[i : i + chunk_size] for i in range(0, len(alvos), chunk_size)]
+        custos = {}
+
+    jobs = []
+    for n, chunk in enumerate(chunks, start=1):
+        grid_filename = os.path.join(grids_dir, f"grid_{n}.in")
+        escrever_grid(grid_filename, chunk, s, rel_base_dir, rel_inputs_dir, rel_out_dir)
+        jobs.append(
+            {
+                "grid": grid_filename,
+                "log": os.path.join(logs_dir, f"grid_{n}.log"),
+                "alvos": chunk,
+                "out_dir": out_dir,
+                "custo": sum(custos.get(a, 0.0) for a in chunk),
+            }
+        )
+    return jobs
+
+
+def resumir_output(out_path):
+    """
+    Lê um .out e retorna a linha do summary. Alvos sem população válida
+    (calculate_mean_properties() == None) ficam com NaN nas médias.
+    """
+    starlight_output = sl_analysis.StarlightOutput(out_path)
+    props = starlight_output.calculate_mean_properties() or {}
+
+    n0 = starlight_output.n0
+    nclip = starlight_output.nclip
+    clip = (nclip / n0) * 100 if n0 and nclip is not None else float("nan")
+
+    return {
+        "Target": os.path.basename(out_path).replace(".out", ""),
+        "Mean Age(by light)": props.get("mean_age_light_gyr", float("nan")),
+        "Mean Z (by light)": props.get("mean_Z_light", float("nan")),
+        "Mean Age (by mass)": props.get("mean_age_mass_gyr", float("nan")),
+        "Mean Z (by mass)": props.get("mean_Z_mass", float("nan")),
+        "A_V": starlight_output.av,
+        "chi2": starlight_output.chi2,
+        "adev": starlight_output.adev,
+        "Clip %": clip,
+        "n0": n0,
+        "nl": starlight_output.nl,
+        "nclip": nclip,
+    }
+
+
+def _resumir_seguro(out_path):
+    try:
+        return resumir_output(out_path), None
+    except Exception as e:
+        return None, f"{os.path.basename(out_path)}: {e}"
+
+
+def _ler_resumos(out_paths, n_workers=1):
+    """
+    Lê os .out em processos paralelos. Arquivos ilegíveis são reportados e ficam de fora.
+
+    Returns:
+        dict: {out_path: linha do summary}, na ordem de out_paths
+    """
+    if n_workers > 1 and len(out_paths) > 1:
+        chunksize = max(1, len(out_paths) // (n_workers * 4))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            resultados = list(executor.map(_resumir_seguro, out_paths, chunksize=chunksize))
+    else:
+        resultados = [_resumir_seguro(p) for p in out_paths]
+
+    linhas = {}
+    for path, (linha, erro) in zip(out_paths, resultados):
+        if erro is not None:
+            print(f"  [ERRO] Leitura: {erro}")
+        else:
+            linhas[path] = linha
+    return linhas
+
+
+def colher_resultados(out_paths, n_workers=1):
+    """
+    Lê os .out em processos paralelos e junta tudo numa única tabela (ordem de out_paths).
+    Arquivos ilegíveis são reportados e ficam de fora.
+
+    Returns:
+        pandas.DataFrame: Uma linha por alvo
+    """
+    import pandas as pd
+
+    linhas = _ler_resumos(out_paths, n_workers)
+    return pd.DataFrame(list(linhas.values()), columns=COLUNAS_SUMMARY)
 
+
+def escrever_summary(df, out_dir, parquet=False):
+    """
+    Grava summary.csv (e summary.parquet, se pedido) numa única escrita atômica.
+    """
+    summary_file = os.path.join(out_dir, "summary.csv")
+    df.to_csv(summary_file + ".tmp", index=False)
+    os.replace(summary_file + ".tmp", summary_file)
+
+    if parquet:
+        try:
+            df.to_parquet(os.path.join(out_dir, "summary.parquet"), index=False)
+        except ImportError:
+            print("  [AVISO] pyarrow/fastparquet não instalado: summary.parquet não gerado.")
+
+
+def carregar_metricas(path):
+    """
+    Lê o metrics.jsonl do scheduler e distribui as métricas de cada processo entre seus
+    ajustes: o tempo vem do mtime de cada .out, a CPU é dividida na mesma proporção e o RSS
+    máximo e o status são os do processo. Se um alvo rodou mais de uma vez, vale o último.
+
+    Returns:
+        pandas.DataFrame: Colunas Config, Target e COLUNAS_METRICAS
+    """
+    import pandas as pd
+
+    linhas = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            registros = [json.loads(l) for l in f if l.strip()]
+        for reg in sorted(registros, key=lambda r: r["inicio"]):
+            total = sum(reg["ajustes"].values()) or 1.0
+            for alvo, tempo in reg["ajustes"].items():
+                fracao = tempo / total
+                linhas[(reg.get("config"), alvo)] = {
+                    "Config": reg.get("config"),
+                    "Target": alvo,
+                    "Tempo [s]": tempo,
+                    "CPU user [s]": reg.get("cpu_user", float("nan")) * fracao,
+                    "CPU sys [s]": reg.get("cpu_sys", float("nan")) * fracao,
+                    "Max RSS [MB]": reg.get("max_rss_mb", float("nan")),
+                    "Status": reg.get("status"),
+                }
+    return pd.DataFrame(list(linhas.values()), columns=["Config", "Target"] + COLUNAS_METRICAS)
+
+
+def juntar_metricas(df, path):
+    """
+    Acrescenta ao summary as colunas de métricas (carregar_metricas), por alvo
+    (e por configuração, se df tem a coluna Config).
+    """
+    metricas = carregar_metricas(path)
+    chaves = ["Config", "Target"] if "Config" in df.columns else ["Target"]
+    if "Config" not in df.columns:
+        metricas = metricas.drop(columns="Config").drop_duplicates("Target", keep="last")
+    return df.merge(metricas, on=chaves, how="left")
+
+
+def correlacoes_metricas(df):
+    """
+    Correlação (Pearson) do tempo e do RSS de cada ajuste com n0, nl e nclip:
+    mostra quais entradas deixam o ajuste caro.
+
+    Returns:
+        pandas.DataFrame: Linhas Tempo [s] e Max RSS [MB], colunas n0, nl e nclip
+    """
+    import pandas as pd
+
+    colunas = ["Tempo [s]", "Max RSS [MB]", "n0", "nl", "nclip"]
+    corr = df[colunas].apply(pd.to_numeric, errors="coerce").corr()
+    return corr.loc[["Tempo [s]", "Max RSS [MB]"], ["n0", "nl", "nclip"]]
+
+
+def anexar_summary(summary_file, linhas):
+    """
+    Acrescenta linhas ao summary.csv assim que ficam prontas. Cada chamada é uma única escrita
+    seguida de fsync: uma queda perde no máximo a linha em andamento, nunca as anteriores.
+    """
+    import pandas as pd
+
+    if not linhas:
+        return
+    novo = not os.path.exists(summary_file) or os.path.getsize(summary_file) == 0
+    texto = pd.DataFrame(linhas, columns=COLUNAS_SUMMARY).to_csv(header=novo, index=False)
+    with open(summary_file, "a") as f:
+        f.write(texto)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def numero_workers():
     total_cores = os.cpu_count() or 1
-    max_workers = int(total_cores * (5 / 6)) or 1
+    return int(total_cores * (5 / 6)) or 1
+
+
+def main(selected_targets=None, retomar=False, streaming=None):
+    """
+    Gera os grids, roda o STARLIGHT em paralelo e resume os resultados em outputs/summary.csv.
+
+    Args:
+        selected_targets [list]: Alvos a rodar (None = seleção interativa)
+        retomar [bool]: Mantém os .out completos gerados com a mesma entrada, base e
+            STARLIGHT_PARAMS e roda só os alvos faltantes ou desatualizados
+        streaming [bool]: Analisa cada .out assim que seu grid termina e acrescenta a linha
+            ao summary.csv durante a execução (padrão: config.STREAMING_SUMMARY)
+    """
+    if streaming is None:
+        streaming = config.STREAMING_SUMMARY
+
+    # Em modo retomar, só grids e logs são refeitos; os outputs válidos ficam
+    work_dirs = ["grids", "logs"] if retomar else ["grids", "outputs", "logs"]
+    for d in work_dirs:
+        full_path = os.path.join(config.PIPELINE_DIR, d)
+        if os.path.exists(full_path):
+            shutil.rmtree(full_path)
+        os.makedirs(full_path)
+    out_dir = os.path.join(config.PIPELINE_DIR, "outputs")
+    os.makedirs(out_dir, exist_ok=True)
+
+    if selected_targets is None:
+        selected_targets = select_targets(config.INPUTS_DIR)
+
+    s = config.STARLIGHT_PARAMS
+
+    impressoes = {}
+    pendentes = alvos_pendentes(selected_targets, s, out_dir, retomar, impressoes)
+    if retomar:
+        print(
+            f"  > Retomando: {len(selected_targets) - len(pendentes)} ajustes atualizados, "
+            f"{len(pendentes)} a rodar."
+        )
+    selected_targets = pendentes
+
+    total_cores = os.cpu_count() or 1
+    max_workers = numero_workers()
+
+    chunk_size = config.CHUNK_SIZE or scheduler.escolher_chunk_size(
+        len(selected_targets), max_workers
+    )
+    # Ordem de submissão: do grid mais caro ao mais barato (histórico ou pixels válidos)
+    custos, pixels = None, {}
+    if config.ORDENAR_JOBS:
+        historico = scheduler.carregar_historico()
+        custos, pixels = scheduler.prever_custos(selected_targets, s, historico)
+    jobs = montar_jobs(
+        selected_targets,
+        s,
+        preparar_base_dir(s),
+        chunk_size,
+        os.path.join(config.PIPELINE_DIR, "grids"),
+        os.path.join(config.PIPELINE_DIR, "logs"),
+        out_dir,
+        custos=custos,
+    )
 
     print(
-        f"  > Hardware detectado: {total_cores} núcleos. Alocando {max_workers} threads simultâneas.\n"
+        f"  > Hardware detectado: {total_cores} núcleos. Alocando {max_workers} threads simultâneas."
     )
+    print(f"  > {len(jobs)} grids com até {chunk_size} ajustes cada.\n")
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        for i, grid_path in enumerate(grids):
-            executor.submit(executar_starlight, i, grid_path)
+    # Paralelização: timeout, novas tentativas e detecção de falhas ficam no scheduler
+    summary_file = os.path.join(out_dir, "summary.csv")
+    if os.path.exists(summary_file):
+        os.remove(summary_file)
+    # Linhas já lidas no modo streaming ({out_path: linha}), reaproveitadas no summary final
+    lidos = {}
+    if streaming and retomar:
+        # Resultados mantidos de execuções anteriores entram logo no summary parcial
+        mantidos = [
+            os.path.join(out_dir, f"{a}.out") for a in impressoes if a not in selected_targets
+        ]
+        lidos.update(_ler_resumos(mantidos, max_workers))
+        anexar_summary(summary_file, list(lidos.values()))
 
-    print(f"   Outputs salvos em: {os.path.join(config.PIPELINE_DIR, 'outputs/')}")
+    def registrar(resultado):
+        concluidos = [a for a in resultado["alvos"] if a not in resultado["faltando"]]
+        for alvo in concluidos:
+            salvar_impressao(out_dir, alvo, impressoes[alvo])
+        if streaming:
+            linhas = []
+            for alvo in concluidos:
+                out_path = os.path.join(out_dir, f"{alvo}.out")
+                linha, erro = _resumir_seguro(out_path)
+                if erro is not None:
+                    print(f"  [ERRO] Leitura: {erro}")
+                else:
+                    lidos[out_path] = linha
+                    linhas.append(linha)
+            anexar_summary(summary_file, linhas)
 
-    # Fazer analise do output
-    for res in sorted(glob.glob(os.path.join(config.PIPELINE_DIR, "outputs/*.out"))):
-        starlight_output = sl_analysis.StarlightOutput(res)
-        props = starlight_output.calculate_mean_properties()
+    metricas_file = os.path.join(out_dir, "metrics.jsonl")
+    resultados = scheduler.executar_jobs(
+        jobs, max_workers, ao_concluir=registrar, metricas=metricas_file
+    )
 
-        df = pd.DataFrame(
-            {
-                "Target": os.path.basename(res).replace(".out", ""),
-                "Mean Age(by light)": props["mean_age_light_gyr"],
-                "Mean Z (by light)": props["mean_Z_light"],
-                "Mean Age (by mass)": props["mean_age_mass_gyr"],
-                "Mean Z (by mass)": props["mean_Z_mass"],
-                "A_V": starlight_output.av,
-                "chi2": starlight_output.chi2,
-                "adev": starlight_output.adev,
-                "Clip %": (starlight_output.nclip / starlight_output.n0) * 100,
-            },
-            index=[0],
-        )
+    historico = scheduler.carregar_historico()
+    scheduler.atualizar_historico(historico, s, resultados, pixels)
+    scheduler.salvar_historico(historico)
 
-        df.to_csv(
-            os.path.join(config.PIPELINE_DIR, "outputs", "summary.csv"),
-            mode="a",
-            header=not os.path.exists(
-                os.path.join(config.PIPELINE_DIR, "outputs", "summary.csv")
-            ),
-            index=False,
+    falhas = [r for r in resultados if not r["ok"]]
+    for r in falhas:
+        print(
+            f"  [ERRO] {os.path.basename(r['grid'])}: {r['erro']} "
+            f"(alvos sem saída: {', '.join(r['faltando']) or 'nenhum'})"
         )
 
+    print(f"   Outputs salvos em: {os.path.join(config.PIPELINE_DIR, 'outputs/')}")
+
+    # Fazer analise do output. No modo streaming, reescreve o summary parcial já ordenado a
+    # partir das linhas já lidas, relendo só os .out que não passaram por registrar
+    import pandas as pd
+
+    out_paths = sorted(glob.glob(os.path.join(out_dir, "*.out")))
+    lidos.update(_ler_resumos([p for p in out_paths if p not in lidos], max_workers))
+    df = pd.DataFrame([lidos[p] for p in out_paths if p in lidos], columns=COLUNAS_SUMMARY)
+    df = juntar_metricas(df, metricas_file)
+    escrever_summary(df, out_dir, parquet=config.SUMMARY_PARQUET)
+    if df["Tempo [s]"].notna().sum() > 2:
+        print("\n  > Correlação do custo dos ajustes com n0/nl/nclip:")
+        print(correlacoes_metricas(df).round(2).to_string())
+
+    if config.EXPORTAR_ACERVO:
+        import acervo
+
+        acervo.exportar(out_paths, "runs", n_workers=max_workers)
+
 
 if __name__ == "__main__":
     main()
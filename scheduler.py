@@ -0,0 +1,548 @@
+import heapq
+import json
+import math
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+import config
+
+# Trechos de log que indicam que o STARLIGHT (Fortran) abortou mesmo com código de saída 0
+PADROES_ERRO = (
+    "forrtl:",
+    "Fortran runtime error",
+    "Segmentation fault",
+    "Program received signal",
+    "Backtrace for this error",
+    "Killed",
+)
+
+N_LINHAS_HEADER_GRID = 15  # Linhas de parâmetros antes da lista de ajustes
+FATOR_FIT = 2.0  # Custo relativo de kine = FIT sem histórico (cinemática livre é mais lenta)
+
+
+def escolher_chunk_size(
+    n_alvos,
+    n_workers,
+    custo_base=config.CUSTO_CARGA_BASE,
+    custo_ajuste=config.CUSTO_MEDIO_AJUSTE,
+):
+    """
+    Escolhe quantos ajustes cada processo do STARLIGHT roda. Chunks maiores carregam a base
+    menos vezes; chunks menores equilibram melhor a carga entre os workers. Minimiza:
+
+        ceil(ceil(n / c) / w) * (b + c * t)  +  (b + c * t) / 2
+
+    onde o primeiro termo é o makespan ideal e o segundo a espera média pelo último chunk.
+
+    Args:
+        n_alvos [int]: Número de alvos
+        n_workers [int]: Processos simultâneos
+        custo_base [float]: Tempo para o STARLIGHT carregar a base [s]
+        custo_ajuste [float]: Tempo médio de um ajuste [s]
+
+    Returns:
+        int: Tamanho do chunk
+    """
+    if n_alvos <= 0:
+        return 1
+    n_workers = max(1, n_workers)
+
+    melhor, melhor_custo = 1, math.inf
+    for c in range(1, math.ceil(n_alvos / n_workers) + 1):
+        duracao_chunk = custo_base + c * custo_ajuste
+        rodadas = math.ceil(math.ceil(n_alvos / c) / n_workers)
+        custo = rodadas * duracao_chunk + duracao_chunk / 2
+        if custo < melhor_custo:
+            melhor, melhor_custo = c, custo
+    return melhor
+
+
+def perfil_execucao(s):
+    """
+    Chave do histórico de tempos: ajustes com mesma base, cinemática e janela custam parecido.
+    """
+    return f"{s['base']}|{s['kine']}|{s['olsyn_ini']}-{s['olsyn_fin']}|{s['delta_lambda']}"
+
+
+def carregar_historico(path=None):
+    path = path or config.HISTORICO_TEMPOS
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def salvar_historico(historico, path=None):
+    path = path or config.HISTORICO_TEMPOS
+    with open(path + ".tmp", "w") as f:
+        json.dump(historico, f)
+    os.replace(path + ".tmp", path)
+
+
+def pixels_validos(in_path, olsyn_ini, olsyn_fin):
+    """
+    Número de pixels com flag 0 dentro da janela do ajuste (preditor barato do custo).
+    """
+    with open(in_path, "rb") as f:
+        campos = f.read().split()
+    l_ambda = np.array(campos[0::4], dtype=float)
+    bons = np.array(campos[3::4]) == b"0"
+    return int(np.count_nonzero(bons & (l_ambda >= olsyn_ini) & (l_ambda <= olsyn_fin)))
+
+
+def prever_custos(alvos, s, historico, inputs_dir=None, nomes_entrada=None):
+    """
+    Tempo previsto de cada ajuste: o histórico do alvo neste perfil quando existe; senão
+    pixels válidos x (tempo por pixel medido no perfil, ou CUSTO_MEDIO_AJUSTE por alvo médio).
+
+    Args:
+        alvos [list]: Alvos
+        s [dict]: Parâmetros do STARLIGHT
+        historico [dict]: carregar_historico()
+        inputs_dir [str]: Diretório dos .in (padrão: config.INPUTS_DIR)
+        nomes_entrada [dict]: alvo -> nome do .in de onde contar pixels (padrão: o próprio alvo)
+
+    Returns:
+        tuple: ({alvo: segundos}, {alvo: pixels válidos dos alvos sem histórico})
+    """
+    inputs_dir = inputs_dir or config.INPUTS_DIR
+    nomes_entrada = nomes_entrada or {}
+    registros = historico.get(perfil_execucao(s), {})
+
+    custos = {a: registros[a]["tempo"] for a in alvos if a in registros}
+    pixels = {}
+    for alvo in alvos:
+        if alvo not in custos:
+            entrada = nomes_entrada.get(alvo, alvo)
+            in_path = os.path.join(inputs_dir, f"{entrada}.in")
+            pixels[alvo] = pixels_validos(in_path, s["olsyn_ini"], s["olsyn_fin"])
+
+    if pixels:
+        por_pixel = [r["tempo"] / r["pixels"] for r in registros.values() if r.get("pixels")]
+        if por_pixel:
+            fator = float(np.median(por_pixel))
+        else:
+            fator = config.CUSTO_MEDIO_AJUSTE / max(1.0, float(np.median(list(pixels.values()))))
+            if s["kine"] == "FIT":
+                fator *= FATOR_FIT
+        custos.update({a: n * fator for a, n in pixels.items()})
+    return custos, pixels
+
+
+def atualizar_historico(historico, s, resultados, pixels=None):
+    """
+    Acrescenta ao histórico os tempos por ajuste medidos nos resultados (métricas do
+    executar_job), com média móvel em relação ao valor anterior.
+    """
+    registros = historico.setdefault(perfil_execucao(s), {})
+    pixels = pixels or {}
+    for resultado in resultados:
+        for registro in resultado.get("metricas", []):
+            for alvo, tempo in registro["ajustes"].items():
+                anterior = registros.get(alvo, {})
+                if "tempo" in anterior:
+                    tempo = 0.5 * (anterior["tempo"] + tempo)
+                registros[alvo] = {
+                    "tempo": tempo,
+                    "pixels": pixels.get(alvo, anterior.get("pixels")),
+                }
+    return historico
+
+
+def empacotar(alvos, custos, chunk_size):
+    """
+    Divide os alvos em ceil(n / chunk_size) grids de carga prevista equilibrada: do mais caro ao
+    mais barato, cada alvo vai para o grid menos carregado que ainda tem vaga (LPT).
+
+    Returns:
+        list: Grids (listas de alvos), do mais caro ao mais barato
+    """
+    if not alvos:
+        return []
+    n_chunks = math.ceil(len(alvos) / chunk_size)
+    heap = [(0.0, i) for i in range(n_chunks)]
+    chunks = [[] for _ in range(n_chunks)]
+    cargas = [0.0] * n_chunks
+    for alvo in sorted(alvos, key=lambda a: custos.get(a, 0.0), reverse=True):
+        carga, i = heapq.heappop(heap)
+        chunks[i].append(alvo)
+        cargas[i] = carga + custos.get(alvo, 0.0)
+        if len(chunks[i]) < chunk_size:
+            heapq.heappush(heap, (cargas[i], i))
+    ordem = sorted(range(n_chunks), key=lambda i: cargas[i], reverse=True)
+    return [chunks[i] for i in ordem]
+
+
+def saida_valida(out_path):
+    """
+    Um .out é considerado válido se existe e está completo: tem o bloco do espectro sintético
+    com todas as linhas declaradas, e a última é uma linha inteira de 4 números terminada em
+    quebra de linha (um ajuste interrompido, mesmo durante a última escrita, deixa o arquivo
+    truncado).
+    """
+    if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
+        return False
+    with open(out_path, "rb") as f:
+        dados = f.read()
+    pos = dados.find(b"## Synthetic spectrum (Best Model) ##")
+    if pos < 0:
+        return False
+    linhas = dados[pos:].splitlines()[1:]
+    try:
+        n_linhas = int(linhas[0].split()[0])
+    except (ValueError, IndexError):
+        return False
+    corpo = [line for line in linhas[1:] if line.strip()]
+    if len(corpo) < n_linhas or not dados.endswith(b"\n"):
+        return False
+    if not corpo:
+        return True
+    campos = corpo[-1].split()
+    if len(campos) != 4:
+        return False
+    try:
+        [float(c) for c in campos]
+    except ValueError:
+        return False
+    return True
+
+
+def _erro_no_log(log_path):
+    try:
+        with open(log_path, "r", errors="replace") as f:
+            texto = f.read()
+    except OSError:
+        return None
+    for padrao in PADROES_ERRO:
+        if padrao in texto:
+            return padrao
+    return None
+
+
+def _grid_parcial(grid_path, alvos, destino):
+    """
+    Copia um grid mantendo só as linhas dos alvos pedidos (usado nas novas tentativas).
+    """
+    with open(grid_path, "r") as f:
+        linhas = f.readlines()
+    header = linhas[:N_LINHAS_HEADER_GRID]
+    ajustes = [l for l in linhas[N_LINHAS_HEADER_GRID:] if l.split()[0][:-3] in alvos]
+    header[0] = f"{len(ajustes)}    [Number of fits to run]\n"
+    with open(destino, "w") as f:
+        f.writelines(header + ajustes)
+    return destino
+
+
+def _uso_recursos(uso):
+    # ru_maxrss é em KiB no Linux e em bytes no macOS
+    escala = 1024**2 if sys.platform == "darwin" else 1024
+    return {
+        "cpu_user": uso.ru_utime,
+        "cpu_sys": uso.ru_stime,
+        "max_rss_mb": uso.ru_maxrss / escala,
+    }
+
+
+def _rodar(grid_path, log_path, cwd, timeout, cancelar=None):
+    """
+    Roda o executável com o grid no stdin. Em timeout, ou quando o evento cancelar é
+    disparado (ex: lease perdido na fila), mata o grupo de processos inteiro.
+    O processo é esperado com os.wait4, que devolve também o uso de recursos do filho.
+
+    Returns:
+        tuple: (código de saída ou None se estourou o tempo ou foi cancelado, tempo [s],
+            {'status', 'cpu_user', 'cpu_sys', 'max_rss_mb'})
+    """
+    inicio = time.monotonic()
+    estourou = threading.Event()
+    terminou = threading.Event()
+    with open(grid_path, "r") as stdin, open(log_path, "w") as log:
+        proc = subprocess.Popen(
+            [config.STARLIGHT_EXE],
+            stdin=stdin,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            cwd=cwd,
+            start_new_session=True,
+        )
+
+        def matar():
+            try:
+                if hasattr(os, "killpg"):
+                    os.killpg(proc.pid, signal.SIGKILL)
+                else:
+                    proc.kill()
+                estourou.set()
+            except ProcessLookupError:
+                pass
+
+        timer = threading.Timer(timeout, matar) if timeout else None
+        if timer is not None:
+            timer.start()
+        vigia = None
+        if cancelar is not None:
+
+            def vigiar():
+                while not terminou.wait(0.5):
+                    if cancelar.is_set():
+                        matar()
+                        return
+
+            vigia = threading.Thread(target=vigiar, daemon=True)
+            vigia.start()
+        try:
+            if hasattr(os, "wait4"):
+                _, status, uso = os.wait4(proc.pid, 0)
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                metricas = _uso_recursos(uso)
+            else:
+                proc.wait()
+                metricas = {}
+        finally:
+            terminou.set()
+            if timer is not None:
+                timer.cancel()
+            if vigia is not None:
+                vigia.join()
+
+    codigo = None if estourou.is_set() else proc.returncode
+    return codigo, time.monotonic() - inicio, {"status": proc.returncode, **metricas}
+
+
+def marcar_inicio(out_dir, grid_path):
+    """
+    Grava o marcador de início de um grid no diretório de saída do STARLIGHT. Seu mtime vem
+    do mesmo relógio que os mtimes dos .out (o do sistema de arquivos que os recebe), então
+    os tempos por ajuste não dependem do relógio do nó que roda o job.
+
+    Returns:
+        str: Caminho do marcador
+    """
+    # Nome único por host, processo e thread: se o job é reentregue a outro worker enquanto
+    # este ainda roda, um não apaga o marcador do outro
+    dono = f"{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}"
+    path = os.path.join(out_dir, f".inicio_{os.path.basename(grid_path)}.{dono}")
+    os.makedirs(out_dir, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(socket.gethostname())
+    return path
+
+
+def _tempos_ajustes(alvos, out_dir, marcador):
+    """
+    Estima o tempo de cada ajuste pelo mtime dos .out: o STARLIGHT grava cada saída ao terminar
+    o ajuste, então o intervalo entre saídas consecutivas é a duração do ajuste (o primeiro
+    inclui a carga da base e é medido a partir do mtime do marcador de início).
+    """
+    try:
+        inicio = os.path.getmtime(marcador)
+    except OSError:
+        return {}
+    tempos = {}
+    anterior = inicio
+    for alvo in alvos:
+        out_path = os.path.join(out_dir, f"{alvo}.out")
+        try:
+            mtime = os.path.getmtime(out_path)
+        except OSError:
+            continue
+        if mtime >= inicio:
+            tempos[alvo] = max(0.0, mtime - anterior)
+            anterior = mtime
+    return tempos
+
+
+def executar_job(job, cwd=None, timeout=None, tentativas=None, cancelar=None):
+    """
+    Roda um grid do STARLIGHT com timeout, detecção de falha e novas tentativas.
+    Falha = timeout, código de saída != 0, erro de runtime no log ou .out ausente/incompleto.
+    Cada nova tentativa roda só os alvos que ainda não têm .out válido. Se todos os .out são
+    válidos, o grid é aceito (com um aviso) mesmo com código de saída != 0 ou erro no log.
+
+    Args:
+        job [dict]: {'grid': caminho, 'log': caminho, 'alvos': [...], 'out_dir': caminho}
+            e, opcionalmente, 'preparar': função chamada com o job antes da primeira execução
+        cwd [str]: Diretório de trabalho do STARLIGHT (padrão: config.PIPELINE_DIR)
+        timeout [float]: Limite por ajuste [s]; o job recebe timeout * len(alvos)
+        tentativas [int]: Número máximo de novas tentativas
+        cancelar [threading.Event]: Se disparado, mata o STARLIGHT em execução e encerra o job
+            como falha, sem novas tentativas
+
+    Returns:
+        dict: job + {'ok', 'tentativas', 'erro', 'faltando', 'tempo', 'metricas'}, onde
+            metricas tem um registro por processo do STARLIGHT (tempo de parede, CPU user/sys,
+            RSS máximo, status de saída e tempo estimado de cada ajuste)
+    """
+    cwd = cwd or config.PIPELINE_DIR
+    timeout = config.JOB_TIMEOUT if timeout is None else timeout
+    tentativas = config.JOB_RETRIES if tentativas is None else tentativas
+
+    grid_path = job["grid"]
+    faltando = list(job["alvos"])
+    erro = None
+    tempo_total = 0.0
+    metricas = []
+
+    rodar = _rodar
+    if config.STAGING:
+        import staging
+
+        rodar = staging.rodar_com_staging
+
+    if job.get("preparar") is not None:
+        # Entradas geradas sob demanda (ex: realizações de Monte Carlo), já na thread do job
+        try:
+            job["preparar"](job)
+        except Exception as e:
+            erro = f"preparação: {e}"
+            print(f"  [FALHA] {os.path.basename(job['grid'])}: {erro}")
+            return {
+                **job,
+                "ok": False,
+                "tentativas": 0,
+                "erro": erro,
+                "faltando": faltando,
+                "tempo": 0.0,
+                "metricas": [],
+            }
+
+    for tentativa in range(tentativas + 1):
+        if cancelar is not None and cancelar.is_set():
+            erro = "cancelado"
+            break
+        if tentativa > 0:
+            grid_path = _grid_parcial(
+                job["grid"], faltando, f"{job['grid'][:-3]}.retry{tentativa}.in"
+            )
+        log_path = job["log"] if tentativa == 0 else f"{job['log'][:-4]}.retry{tentativa}.log"
+
+        limite = timeout * len(faltando) if timeout else None
+        inicio = time.time()
+        marcador = marcar_inicio(job["out_dir"], grid_path)
+        try:
+            codigo, tempo, uso = rodar(grid_path, log_path, cwd, limite, cancelar)
+            ajustes = _tempos_ajustes(faltando, job["out_dir"], marcador)
+        except Exception as e:
+            # Executável ausente, staging sem espaço, base ou grid malformados...: repetir não
+            # ajudaria. O job sai como falha em vez de derrubar o lote inteiro
+            erro = f"execução: {e}"
+            print(f"  [FALHA] {os.path.basename(job['grid'])} (tentativa {tentativa + 1}): {erro}")
+            break
+        finally:
+            if os.path.exists(marcador):
+                os.remove(marcador)
+        tempo_total += tempo
+        metricas.append(
+            {
+                "grid": os.path.basename(job["grid"]),
+                "config": job.get("config"),
+                "host": socket.gethostname(),
+                "tentativa": tentativa + 1,
+                "alvos": faltando,
+                "inicio": inicio,
+                "tempo": tempo,
+                **uso,
+                "timeout": codigo is None,
+                "ajustes": ajustes,
+            }
+        )
+
+        faltando = [
+            a for a in faltando if not saida_valida(os.path.join(job["out_dir"], f"{a}.out"))
+        ]
+        if cancelar is not None and cancelar.is_set():
+            erro = "cancelado"
+            print(f"  [FALHA] {os.path.basename(job['grid'])} (tentativa {tentativa + 1}): {erro}")
+            break
+        padrao = _erro_no_log(log_path)
+        if codigo is None:
+            erro = f"timeout ({limite:.0f} s)"
+        elif codigo != 0:
+            erro = f"código de saída {codigo}"
+        elif padrao is not None:
+            erro = f"erro no log: {padrao}"
+        elif faltando:
+            erro = f"{len(faltando)} .out ausentes"
+        else:
+            erro = None
+
+        if erro is None:
+            break
+        if not faltando:
+            # Todos os .out existem e estão completos: aceita o grid, novas tentativas não
+            # mudariam as saídas
+            print(
+                f"  [AVISO] {os.path.basename(job['grid'])} (tentativa {tentativa + 1}): {erro}, "
+                "mas todos os .out estão completos; saídas aceitas."
+            )
+            erro = None
+            break
+        print(f"  [FALHA] {os.path.basename(job['grid'])} (tentativa {tentativa + 1}): {erro}")
+
+    return {
+        **job,
+        "ok": erro is None,
+        "tentativas": tentativa + 1,
+        "erro": erro,
+        "faltando": faltando,
+        "tempo": tempo_total,
+        "metricas": metricas,
+    }
+
+
+def salvar_metricas(path, resultado):
+    """
+    Acrescenta os registros de métricas de um job a um arquivo JSON lines.
+    """
+    with open(path, "a") as f:
+        for registro in resultado.get("metricas", []):
+            f.write(json.dumps(registro) + "\n")
+
+
+def executar_jobs(
+    jobs, n_workers, cwd=None, timeout=None, tentativas=None, ao_concluir=None, metricas=None
+):
+    """
+    Roda todos os grids num pool de threads (cada thread espera um processo do STARLIGHT).
+    ao_concluir, se dado, é chamado na thread principal com cada resultado assim que o grid termina.
+    Com config.EXECUTOR = "fila", os grids são publicados na fila compartilhada (fila.py) e
+    rodados pelos workers dos nós; n_workers e cwd ficam a cargo de cada worker.
+    metricas, se dado, é o arquivo JSON lines onde as métricas de cada processo são acrescentadas.
+
+    Returns:
+        list: Resultados de executar_job, na ordem de conclusão
+    """
+
+    def concluir(resultado):
+        if metricas is not None:
+            salvar_metricas(metricas, resultado)
+        if ao_concluir is not None:
+            ao_concluir(resultado)
+
+    if config.EXECUTOR == "fila":
+        import fila
+
+        return fila.executar_jobs_fila(jobs, timeout, tentativas, concluir)
+    if config.EXECUTOR != "local":
+        raise ValueError(f"EXECUTOR desconhecido: {config.EXECUTOR!r} (use 'local' ou 'fila')")
+
+    resultados = []
+    with ThreadPoolExecutor(max_workers=max(1, n_workers)) as executor:
+        futures = [
+            executor.submit(executar_job, job, cwd, timeout, tentativas) for job in jobs
+        ]
+        for future in as_completed(futures):
+            resultado = future.result()
+            status = "CONCLUÍDO" if resultado["ok"] else "FALHOU"
+            print(f"  [{status}] {os.path.basename(resultado['grid'])}")
+            concluir(resultado)
+            resultados.append(resultado)
+    return resultados
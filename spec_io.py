@@ -0,0 +1,165 @@
+import os
+
+import numpy as np
+
+# Formatos ASCII lidos pelo STARLIGHT (idênticos aos gerados antes com np.savetxt)
+FMT_IN = "%.1f %.16e %.16e %d\n"  # lambda fluxo erro flag
+FMT_SPEC = "%.18e %.18e\n"  # lambda fluxo (padrão do np.savetxt)
+
+LINHAS_POR_BLOCO = 65536
+
+# CTYPE1 lineares (sem código de algoritmo) que dispensam o WCS completo
+CTYPES_LINEARES = ("", "LINEAR", "PIXEL", "WAVE", "AWAV")
+CTYPES_ESPECTRAIS = ("WAVE", "AWAV")
+# Fatores para metros: o astropy.wcs converte eixos espectrais para unidades SI
+UNIDADES_EM_METROS = {
+    "": 1.0,
+    "m": 1.0,
+    "cm": 1e-2,
+    "mm": 1e-3,
+    "um": 1e-6,
+    "nm": 1e-9,
+    "angstrom": 1e-10,
+    "aa": 1e-10,
+    "a": 1e-10,
+}
+
+
+def _formatar_tabela(dados, fmt_linha):
+    """
+    Formata uma tabela 2-D como texto, um bloco de linhas por operação de formatação.
+    Equivale a np.savetxt (que formata linha a linha em Python), mas em blocos.
+    """
+    partes = []
+    for inicio in range(0, len(dados), LINHAS_POR_BLOCO):
+        bloco = dados[inicio : inicio + LINHAS_POR_BLOCO]
+        partes.append((fmt_linha * len(bloco)) % tuple(bloco.ravel().tolist()))
+    return "".join(partes)
+
+
+def escrever_tabela(path, colunas, fmt_linha, sidecar=False):
+    """
+    Escreve colunas num arquivo ASCII com uma única escrita bufferizada.
+    O arquivo é gerado num temporário e renomeado, então nunca fica truncado.
+
+    Args:
+        path [str]: Arquivo de saída
+        colunas [tuple]: Arrays 1-D de mesmo tamanho
+        fmt_linha [str]: Formato de uma linha (ex: FMT_IN)
+        sidecar [bool]: Salva também {path}.npy com a tabela binária (float64)
+    """
+    dados = np.column_stack(colunas).astype(float, copy=False)
+    texto = _formatar_tabela(dados, fmt_linha)
+
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(texto)
+    os.replace(tmp, path)
+
+    if sidecar:
+        tmp_npy = path + ".tmp.npy"
+        np.save(tmp_npy, dados)
+        os.replace(tmp_npy, path + ".npy")
+
+
+def escrever_in(path, lambdas, fluxo, erro, flag, sidecar=False):
+    """
+    Escreve um espectro de entrada do STARLIGHT (.in): lambda, fluxo, erro e flag.
+    """
+    escrever_tabela(path, (lambdas, fluxo, erro, flag), FMT_IN, sidecar=sidecar)
+
+
+def escrever_spec(path, lambdas, fluxo, sidecar=False):
+    """
+    Escreve um espectro de base do STARLIGHT (.spec): lambda e fluxo.
+    """
+    escrever_tabela(path, (lambdas, fluxo), FMT_SPEC, sidecar=sidecar)
+
+
+def ler_tabela(path):
+    """
+    Lê um .in/.spec como array 2-D (linhas x colunas).
+    Usa o sidecar {path}.npy quando existe e não é mais antigo que o texto.
+    """
+    npy = path + ".npy"
+    if os.path.exists(npy) and os.path.getmtime(npy) >= os.path.getmtime(path):
+        return np.load(npy)
+    return np.loadtxt(path, ndmin=2)
+
+
+def lambdas_lineares(header, n_pix):
+    """
+    Eixo de lambda de um header FITS 1-D com dispersão linear (CRVAL1/CDELT1/CRPIX1 ou CD1_1),
+    calculado direto com NumPy. Retorna o mesmo que WCS(header).pixel_to_world_values, inclusive
+    a conversão de eixos WAVE/AWAV para metros, ou None se o header não for linear simples.
+    """
+    if header.get("NAXIS", 1) > 1 or header.get("WCSAXES", 1) > 1:
+        return None
+
+    ctype = str(header.get("CTYPE1", "")).strip().upper()
+    if ctype not in CTYPES_LINEARES:
+        return None
+    if any(k.startswith(("PV1_", "PS1_")) for k in header.keys()):
+        return None
+
+    fator = 1.0
+    if ctype in CTYPES_ESPECTRAIS:
+        unidade = str(header.get("CUNIT1", "")).strip().lower()
+        if unidade not in UNIDADES_EM_METROS:
+            return None
+        fator = UNIDADES_EM_METROS[unidade]
+
+    crval = float(header.get("CRVAL1", 0.0))
+    crpix = float(header.get("CRPIX1", 0.0))
+    if "CD1_1" in header:
+        cdelt = float(header["CD1_1"])
+    else:
+        cdelt = float(header.get("CDELT1", 1.0)) * float(header.get("PC1_1", 1.0))
+
+    pixels = np.arange(n_pix, dtype=float)
+    return (crval * fator) + (cdelt * fator) * (pixels + 1 - crpix)
+
+
+def lambdas_fits(header, n_pix):
+    """
+    Eixo de lambda (valores de mundo do WCS) de um espectro 1-D.
+    Usa lambdas_lineares quando possível e recorre ao astropy.wcs para headers não lineares.
+    """
+    lambdas = lambdas_lineares(header, n_pix)
+    if lambdas is not None:
+        return lambdas
+
+    from astropy.wcs import WCS
+
+    lambdas = WCS(header).pixel_to_world_values(np.arange(n_pix))
+    if isinstance(lambdas, tuple):
+        lambdas = lambdas[0]
+    return lambdas
+
+
+def ler_fits(filepath, com_erro=False):
+    """
+    Lê um espectro FITS: eixo de lambda pelo header (lambdas_fits), fluxo do HDU primário.
+
+    Args:
+        filepath [str]: Arquivo FITS
+        com_erro [bool]: Lê também o erro da extensão 1 (NaN se não existir)
+
+    Returns:
+        tuple: (lambdas, fluxo) ou (lambdas, fluxo, erro)
+    """
+    from astropy.io import fits
+
+    with fits.open(filepath) as file:
+        flux = file[0].data
+        header = file[0].header
+        if com_erro:
+            try:
+                error = file[1].data
+            except IndexError:
+                error = np.full_like(flux, np.nan)
+        lambdas = lambdas_fits(header, len(flux))
+
+    if com_erro:
+        return lambdas, flux, error
+    return lambdas, flux
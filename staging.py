@@ -0,0 +1,213 @@
+import fcntl
+import getpass
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import config
+import scheduler
+
+# Staging local: em vez de cada processo do STARLIGHT ler base, máscara, configuração e entradas
+# do disco compartilhado, o nó copia tudo uma vez para um diretório rápido (/dev/shm) e roda de
+# lá. Tudo é deduzido do próprio grid, então funciona para runs, sweep, mc e para a fila.
+#
+#   <STAGING_DIR>/<chave>/            arquivo de base, máscara e configuração (cwd do STARLIGHT)
+#   <STAGING_DIR>/<chave>/base/       espectros listados no arquivo de base
+#   <STAGING_DIR>/<chave>/jobs/<id>/  entradas (in/) e saídas (out/) de um grid
+
+_contador = 0
+_contador_lock = threading.Lock()
+
+
+def diretorio_staging():
+    if config.STAGING_DIR:
+        return config.STAGING_DIR
+    raiz = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(raiz, f"starlight_{getpass.getuser()}")
+
+
+def ler_grid(grid_path):
+    """
+    Returns:
+        tuple: (linhas do header, linhas de ajuste já separadas em campos)
+    """
+    with open(grid_path, "r") as f:
+        linhas = f.readlines()
+    header = linhas[: scheduler.N_LINHAS_HEADER_GRID]
+    ajustes = [l.split() for l in linhas[scheduler.N_LINHAS_HEADER_GRID :] if l.strip()]
+    return header, ajustes
+
+
+def _trocar_caminho(linha, caminho):
+    # Troca só o primeiro campo da linha do header, mantendo o comentário
+    return caminho + linha[len(linha.split()[0]) :]
+
+
+def _chave_area(cwd, base_dir, arquivos, espectros):
+    """
+    Identifica a área do nó pelo conteúdo a copiar (caminho, tamanho e mtime de cada arquivo):
+    se a base ou a máscara mudar no disco compartilhado, uma área nova é criada.
+    """
+    itens = []
+    for path in [os.path.join(cwd, a) for a in arquivos] + [
+        os.path.join(cwd, base_dir, e) for e in espectros
+    ]:
+        st = os.stat(path)
+        itens.append([path, st.st_size, st.st_mtime_ns])
+    return hashlib.sha256(json.dumps(itens).encode()).hexdigest()[:16]
+
+
+def _copiar(origem, destino):
+    # Hard link quando a área está no mesmo sistema de arquivos, cópia caso contrário
+    try:
+        os.link(origem, destino)
+    except OSError:
+        shutil.copy2(origem, destino)
+
+
+def _travar(lock_path):
+    """
+    Abre o arquivo de lock e o trava com lock exclusivo. Se o arquivo foi apagado por
+    _remover_areas_antigas enquanto esperávamos, tenta de novo com o arquivo novo.
+    """
+    while True:
+        lock = open(lock_path, "a")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if os.stat(lock_path).st_ino == os.fstat(lock.fileno()).st_ino:
+                return lock
+        except FileNotFoundError:
+            pass
+        lock.close()
+
+
+def _remover_areas_antigas(raiz, atual):
+    """
+    Apaga as áreas que nenhum grid está usando (lock compartilhado livre) e que não são usadas
+    há mais de config.STAGING_RETENCAO s: em /dev/shm elas ocupam RAM até serem removidas.
+    """
+    for nome in os.listdir(raiz):
+        area = os.path.join(raiz, nome)
+        if area == atual or nome.startswith(".") or not os.path.isdir(area):
+            continue
+        lock_path = area + ".lock"
+        try:
+            with open(lock_path, "a") as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # Em uso por algum grid deste nó
+                if time.time() - os.path.getmtime(lock_path) < config.STAGING_RETENCAO:
+                    continue
+                shutil.rmtree(area, ignore_errors=True)
+                os.remove(lock_path)
+        except OSError:
+            continue
+        print(f"  > Staging: área antiga removida: {area}")
+
+
+def preparar_area(cwd, base_dir, ajustes):
+    """
+    Cria (uma vez por nó, protegido por lock de arquivo) a área com arquivo de base, máscara,
+    configuração e espectros da base usados pelos ajustes do grid. Ao criar uma área nova,
+    remove as áreas antigas sem uso (_remover_areas_antigas).
+
+    Returns:
+        tuple: (diretório da área, arquivo de lock aberto com lock compartilhado, que impede
+            a remoção da área enquanto o grid roda; o chamador o fecha ao terminar)
+    """
+    import miles
+
+    arquivos = sorted({a for campos in ajustes for a in (campos[1], campos[2], campos[3])})
+    espectros = sorted(
+        {e for campos in ajustes for e in miles.ler_base(os.path.join(cwd, campos[2]))}
+    )
+    raiz = diretorio_staging()
+    os.makedirs(raiz, exist_ok=True)
+    area = os.path.join(raiz, _chave_area(cwd, base_dir, arquivos, espectros))
+
+    lock = _travar(area + ".lock")
+    try:
+        # O mtime do lock marca o último uso da área (ver _remover_areas_antigas)
+        os.utime(area + ".lock")
+        if not os.path.isdir(area):
+            tmp = tempfile.mkdtemp(dir=raiz, prefix=".area-")
+            os.makedirs(os.path.join(tmp, "base"))
+            for a in arquivos:
+                _copiar(os.path.join(cwd, a), os.path.join(tmp, a))
+            for e in espectros:
+                _copiar(os.path.join(cwd, base_dir, e), os.path.join(tmp, "base", e))
+            os.rename(tmp, area)
+            _remover_areas_antigas(raiz, area)
+        fcntl.flock(lock, fcntl.LOCK_SH)
+    except Exception:
+        lock.close()
+        raise
+    return area, lock
+
+
+def _id_job():
+    global _contador
+    with _contador_lock:
+        _contador += 1
+        return f"{os.getpid()}_{_contador}"
+
+
+def rodar_com_staging(grid_path, log_path, cwd, timeout, cancelar=None):
+    """
+    Substituto de scheduler._rodar com config.STAGING: copia as entradas do grid para a área
+    local do nó, roda o STARLIGHT a partir dela e devolve cada .out ao out_dir original com
+    escrita atômica (cópia temporária + os.replace, preservando o mtime), junto com o
+    marcador de início (scheduler.marcar_inicio).
+    """
+    header, ajustes = ler_grid(grid_path)
+    base_dir, obs_dir, out_dir = (header[i].split()[0] for i in (1, 2, 4))
+
+    area, lock = preparar_area(cwd, base_dir, ajustes)
+    job_dir = os.path.join(area, "jobs", _id_job())
+
+    try:
+        os.makedirs(os.path.join(job_dir, "in"))
+        os.makedirs(os.path.join(job_dir, "out"))
+        for campos in ajustes:
+            _copiar(
+                os.path.join(cwd, obs_dir, campos[0]), os.path.join(job_dir, "in", campos[0])
+            )
+        rel_job = os.path.relpath(job_dir, area)
+        header[1] = _trocar_caminho(header[1], "base" + os.sep)
+        header[2] = _trocar_caminho(header[2], os.path.join(rel_job, "in") + os.sep)
+        header[4] = _trocar_caminho(header[4], os.path.join(rel_job, "out") + os.sep)
+        grid_local = os.path.join(job_dir, os.path.basename(grid_path))
+        with open(grid_local, "w") as f:
+            f.writelines(header + ["   ".join(campos) + "\n" for campos in ajustes])
+
+        # O marcador de início do scheduler é refeito na área local: volta ao out_dir junto
+        # com os .out (copy2 preserva os mtimes), e os tempos por ajuste usam um só relógio
+        scheduler.marcar_inicio(os.path.join(job_dir, "out"), grid_path)
+        resultado = scheduler._rodar(grid_local, log_path, area, timeout, cancelar)
+
+        destino = os.path.join(cwd, out_dir)
+        os.makedirs(destino, exist_ok=True)
+        for nome in os.listdir(os.path.join(job_dir, "out")):
+            tmp = os.path.join(destino, f".{nome}.tmp")
+            shutil.copy2(os.path.join(job_dir, "out", nome), tmp)
+            os.replace(tmp, os.path.join(destino, nome))
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        os.utime(area + ".lock")
+        lock.close()
+    return resultado
+
+
+def limpar():
+    """
+    Apaga todas as áreas de staging deste nó (não use com workers rodando).
+    """
+    raiz = diretorio_staging()
+    if os.path.isdir(raiz):
+        shutil.rmtree(raiz)
+        print(f"  > Staging removido: {raiz}")
@@ -1,8 +1,44 @@
 import os
 
-import matplotlib.pyplot as plt
 import numpy as np
 
+# Chaves do cabeçalho do .out: (trecho da linha, atributo, tipo do primeiro campo)
+CHAVES_HEADER = (
+    ("[chi2/Nl_eff]", "chi2", float),  # Qui^2
+    ("[adev (%)]", "adev", float),  # Desvio
+    ("[AV_min", "av", float),  # Extinção (A_V) [magnitudes]
+    ("[v0_min", "v0", float),  # V [km/s]
+    ("[vd_min", "vd", float),  # Dispersão de velocidade [km/s]
+    ("[NOl_eff]", "n0", int),  # Número de pontos usados no ajuste
+    ("[Nl_eff]", "nl", int),  # Número de pontos efetivos
+    ("[Ntot_cliped & clip_method]", "nclip", int),  # Número de pontos clipados
+    ("[arq_base]", "base", str),  # Base usada
+)
+MARCADOR_ESPECTRO = b"## Synthetic spectrum (Best Model) ##"
+COLUNAS_ESPECTRO = ("l_obs", "f_obs", "f_syn", "wei")
+BLOCO_LEITURA = 1 << 16
+
+
+def _decodificar_tabela(linhas, n_cols):
+    """
+    Converte de uma vez as linhas (já separadas em campos) numa matriz float. Se alguma
+    linha estiver truncada ou tiver um campo não numérico, só essa linha é descartada.
+
+    Returns:
+        np.array: Matriz (n_linhas x n_cols)
+    """
+    try:
+        return np.array(linhas, dtype=float).reshape(-1, n_cols)
+    except ValueError:
+        validas = []
+        for cols in linhas:
+            try:
+                if len(cols) == n_cols:
+                    validas.append([float(c) for c in cols])
+            except ValueError:
+                pass
+        return np.array(validas, dtype=float).reshape(-1, n_cols)
+
 
 class StarlightOutput:
     """
@@ -34,82 +70,50 @@ class StarlightOutput:
             "Z": [],  # Metalicidade
         }
 
-        # Tabela final "Synthetic spectrum"
-        this.spectrum = {
-            "l_obs": [],  # Comprimento de onda (Angstrom)
-            "f_obs": [],  # Fluxo Observado
-            "f_syn": [],  # Fluxo Modelo
-            "wei": [],  # Peso: >0 usado, <=0 mascarado/clipado
-        }
-
-        this.min_lambda = None
-        this.max_lambda = None
+        # Tabela final "Synthetic spectrum": lida só no primeiro acesso (ver spectrum)
+        this._spectrum = None
+        this._offset_spectrum = None
 
         # Executa a leitura imediata ao instanciar a classe
         this.read_file()
 
     def read_file(this):
         """
-        Lê o arquivo .out linha por linha e importa os atributos da classe.
-        Usa flags de estado (reading_population, reading_spectrum) para navegar pelas seções.
+        Lê o cabeçalho e a tabela de populações do arquivo .out numa única varredura.
+        O arquivo é lido em blocos só até o marcador do espectro sintético, que é a última
+        seção (e quase todo o arquivo): o offset fica guardado e o espectro só é lido se
+        this.spectrum for usado.
         """
         if not os.path.exists(this.filepath):
             raise FileNotFoundError(f"Arquivo não encontrado: {this.filepath}")
 
-        with open(this.filepath, "r") as f:
-            lines = f.readlines()
-
+        dados = bytearray()
+        with open(this.filepath, "rb") as f:
+            while True:
+                bloco = f.read(BLOCO_LEITURA)
+                inicio = max(0, len(dados) - len(MARCADOR_ESPECTRO))
+                dados += bloco
+                pos = dados.find(MARCADOR_ESPECTRO, inicio)
+                if pos >= 0 or not bloco:
+                    break
+        if pos >= 0:
+            this._offset_spectrum = pos
+            dados = dados[:pos]
+        lines = dados.decode("latin-1").splitlines()
+
+        linhas_populacao = []
         reading_population = False
-        reading_spectrum = False
 
-        for i, line in enumerate(lines):
+        for line in lines:
             line = line.strip()
 
-            if "[chi2/Nl_eff]" in line:
-                try:
-                    this.chi2 = float(line.split()[0])
-                except:
-                    this.chi2 = np.nan
-            elif "[adev (%)]" in line:
-                try:
-                    this.adev = float(line.split()[0])
-                except:
-                    this.adev = np.nan
-            elif "[AV_min" in line:
-                try:
-                    this.av = float(line.split()[0])
-                except:
-                    this.av = np.nan
-            elif "[v0_min" in line:
-                try:
-                    this.v0 = float(line.split()[0])
-                except:
-                    this.v0 = np.nan
-            elif "[vd_min" in line:
-                try:
-                    this.vd = float(line.split()[0])
-                except:
-                    this.vd = np.nan
-            elif "[NOl_eff]" in line:
-                try:
-                    this.n0 = int(line.split()[0])
-                except:
-                    this.n0 = np.nan
-            elif "[Nl_eff]" in line:
-                try:
-                    this.nl = int(line.split()[0])
-                except:
-                    this.nl = np.nan
-            elif "[Ntot_cliped & clip_method]" in line:
-                try:
-                    this.nclip = int(line.split()[0])
-                except:
-                    this.nclip = np.nan
-            elif "[arq_base]" in line:
-                try:
-                    this.base = line.split()[0]
-                except:
-                    this.base = None
+            for chave, atributo, tipo in CHAVES_HEADER:
+                if chave in line:
+                    try:
+                        setattr(this, atributo, tipo(line.split()[0]))
+                    except (ValueError, IndexError):
+                        setattr(this, atributo, None if tipo is str else np.nan)
+                    break
 
             # Identifica o cabeçalho: "# j x_j(%)..."
             if line.startswith("# j") and "x_j(%)" in line:
@@ -121,55 +125,58 @@ class StarlightOutput:
                 if len(line) == 0 or line.startswith("##"):
                     reading_population = False
                 else:
-                    cols = line.split()
-                    try:
-                        this.population["j"].append(int(cols[0]))
-                        this.population["x_j"].append(
-                            float(cols[1])
-                        )  # Fração de luz [%]
-                        this.population["m_ini"].append(
-                            float(cols[2])
-                        )  # Fração de massa inicial [%]
-                        this.population["m_cor"].append(
-                            float(cols[3])
-                        )  # Fração de massa atual [%]
-                        this.population["age"].append(float(cols[4]))  # [anos]
-                        this.population["Z"].append(float(cols[5]))
-                    except (ValueError, IndexError):
-                        pass
-
-            if "## Synthetic spectrum (Best Model) ##" in line:
-                reading_spectrum = True
-                continue
+                    linhas_populacao.append(line.split()[:6])
 
-            if reading_spectrum:
-                cols = line.split()
-                # pula o número de pontos na primeira linha
-                if len(cols) == 1:
-                    continue
+        # j, x_j [%], Mini_j [%], Mcor_j [%], idade [anos], Z
+        tabela = _decodificar_tabela(linhas_populacao, 6)
+        this.population = {"j": tabela[:, 0].astype(int)}
+        for k, key in enumerate(("x_j", "m_ini", "m_cor", "age", "Z"), start=1):
+            this.population[key] = tabela[:, k]
 
-                # lambda obs_flux syn_flux weight
-                if len(cols) >= 3:
-                    try:
-                        this.spectrum["l_obs"].append(float(cols[0]))
-                        this.spectrum["f_obs"].append(float(cols[1]))
-                        this.spectrum["f_syn"].append(float(cols[2]))
-                        this.spectrum["wei"].append(float(cols[3]))
-                    except ValueError:
-                        pass
-
-        # Converte listas python para numpy
-        for key in this.population:
-            this.population[key] = np.array(this.population[key])
-        for key in this.spectrum:
-            this.spectrum[key] = np.array(this.spectrum[key])
-
-        this.min_lambda = (
-            np.min(this.spectrum["l_obs"]) if len(this.spectrum["l_obs"]) > 0 else None
-        )
-        this.max_lambda = (
-            np.max(this.spectrum["l_obs"]) if len(this.spectrum["l_obs"]) > 0 else None
-        )
+    @property
+    def spectrum(this):
+        """
+        Tabela "Synthetic spectrum": l_obs (Angstrom), f_obs, f_syn e wei (>0 usado,
+        <=0 mascarado/clipado). Decodificada de uma vez no primeiro acesso.
+        """
+        if this._spectrum is None:
+            this._spectrum = this._read_spectrum()
+        return this._spectrum
+
+    @property
+    def min_lambda(this):
+        l_obs = this.spectrum["l_obs"]
+        return np.min(l_obs) if len(l_obs) > 0 else None
+
+    @property
+    def max_lambda(this):
+        l_obs = this.spectrum["l_obs"]
+        return np.max(l_obs) if len(l_obs) > 0 else None
+
+    def _read_spectrum(this):
+        if this._offset_spectrum is None:
+            return {key: np.array([]) for key in COLUNAS_ESPECTRO}
+
+        with open(this.filepath, "rb") as f:
+            f.seek(this._offset_spectrum)
+            f.readline()  # linha do marcador
+            resto = f.read()
+
+        # pula o número de pontos na primeira linha
+        primeira, _, corpo = resto.partition(b"\n")
+        if len(primeira.split()) >= 3:
+            corpo = resto
+
+        # lambda obs_flux syn_flux weight: uma conversão só para o bloco inteiro
+        try:
+            tabela = np.array(corpo.split(), dtype=float)
+            if tabela.size % 4:
+                raise ValueError
+            tabela = tabela.reshape(-1, 4)
+        except ValueError:
+            linhas = [l.split()[:4] for l in resto.splitlines()]
+            tabela = _decodificar_tabela([cols for cols in linhas if len(cols) >= 3], 4)
+        return {key: tabela[:, k] for k, key in enumerate(COLUNAS_ESPECTRO)}
 
     def calculate_mean_properties(this):
         """
@@ -214,6 +221,8 @@ class StarlightOutput:
         Plota o ajuste espectral (Observado vs Modelo com as bases)
         Destaca pontos clipados e qualidade (Chi2, Adev).
         """
+        import matplotlib.pyplot as plt
+
         l = this.spectrum["l_obs"]
         fo = this.spectrum["f_obs"]
         fs = this.spectrum["f_syn"]
@@ -0,0 +1,234 @@
+import glob
+import itertools
+import json
+import os
+import shutil
+
+import config
+import runs
+import scheduler
+
+SWEEP_DIR = os.path.join(config.PIPELINE_DIR, "sweeps")
+
+# "janela" é um atalho para a janela do ajuste: (olsyn_ini, olsyn_fin)
+CHAVES_JANELA = ("olsyn_ini", "olsyn_fin")
+# Parâmetros que definem a base recortada (runs.preparar_base_dir); template_config entra
+# pelos lambdas de normalização (l_norm, llow_norm, lupp_norm) lidos dele
+CHAVES_RECORTE = (
+    "base",
+    "base_dir",
+    "olsyn_ini",
+    "olsyn_fin",
+    "delta_lambda",
+    "lllow_SN",
+    "llup_SN",
+    "template_config",
+)
+
+
+def expandir_grade(grade):
+    """
+    Lista as configurações de uma varredura.
+
+    Args:
+        grade [dict | list]: {parâmetro: [valores]} (produto cartesiano) ou lista de
+            {parâmetro: valor} (configurações explícitas). Parâmetros são chaves de
+            config.STARLIGHT_PARAMS, mais "janela" = (olsyn_ini, olsyn_fin)
+
+    Returns:
+        list: Dicts só com os parâmetros alterados, na ordem da grade
+    """
+    if isinstance(grade, dict):
+        chaves = list(grade)
+        variantes = [
+            dict(zip(chaves, valores)) for valores in itertools.product(*grade.values())
+        ]
+    else:
+        variantes = [dict(v) for v in grade]
+
+    configuracoes = []
+    for v in variantes:
+        if "janela" in v:
+            v.update(zip(CHAVES_JANELA, v.pop("janela")))
+        desconhecidos = set(v) - set(config.STARLIGHT_PARAMS)
+        if desconhecidos:
+            raise KeyError(f"Parâmetros desconhecidos: {', '.join(sorted(desconhecidos))}")
+        configuracoes.append(v)
+    return configuracoes
+
+
+def rotulo_configuracao(i, variacao):
+    """
+    Rótulo (e nome de diretório) de uma configuração: cfg001_seed-112017_vd-150.0
+    """
+    partes = [f"cfg{i + 1:03d}"]
+    for chave, valor in variacao.items():
+        valor = str(valor).replace(os.sep, "-").replace(" ", "")
+        partes.append(f"{chave}-{valor}")
+    return "_".join(partes)
+
+
+def preparar_configuracoes(configuracoes, sweep_dir, retomar=False):
+    """
+    Cria sweep_dir/<rótulo>/{grids,logs,outputs} para cada configuração e grava
+    sweep_dir/configuracoes.json com os parâmetros completos de cada uma.
+
+    Returns:
+        list: Dicts {'rotulo', 'variacao', 'params', 'grids', 'logs', 'outputs'}
+    """
+    preparadas = []
+    for i, variacao in enumerate(configuracoes):
+        rotulo = rotulo_configuracao(i, variacao)
+        cfg_dir = os.path.join(sweep_dir, rotulo)
+        dirs = {d: os.path.join(cfg_dir, d) for d in ("grids", "logs", "outputs")}
+        for d, path in dirs.items():
+            if os.path.exists(path) and (d != "outputs" or not retomar):
+                shutil.rmtree(path)
+            os.makedirs(path, exist_ok=True)
+        preparadas.append(
+            {
+                "rotulo": rotulo,
+                "variacao": variacao,
+                "params": {**config.STARLIGHT_PARAMS, **variacao},
+                **dirs,
+            }
+        )
+
+    with open(os.path.join(sweep_dir, "configuracoes.json"), "w") as f:
+        json.dump({c["rotulo"]: c["params"] for c in preparadas}, f, indent=2)
+    return preparadas
+
+
+def main(grade, selected_targets=None, nome="sweep", retomar=False):
+    """
+    Roda o STARLIGHT em todas as configurações de uma varredura de parâmetros.
+    Os .in e as bases recortadas são compartilhados; cada configuração tem seus grids, logs e
+    saídas em sweeps/<nome>/<rótulo>/, e todos os grids vão para um único pool de workers.
+    O resumo fica em sweeps/<nome>/summary.csv, com uma linha por alvo e configuração.
+
+    Args:
+        grade [dict | list]: Ver expandir_grade
+        selected_targets [list]: Alvos a rodar (None = seleção interativa)
+        nome [str]: Nome da varredura (subdiretório de sweeps/)
+        retomar [bool]: Mantém os .out completos e atualizados de cada configuração
+    """
+    import pandas as pd
+
+    configuracoes = expandir_grade(grade)
+    sweep_dir = os.path.join(SWEEP_DIR, nome)
+    os.makedirs(sweep_dir, exist_ok=True)
+    preparadas = preparar_configuracoes(configuracoes, sweep_dir, retomar)
+
+    if selected_targets is None:
+        selected_targets = runs.select_targets(config.INPUTS_DIR)
+
+    max_workers = runs.numero_workers()
+
+    impressoes = {}
+    pendentes = {}
+    for c in preparadas:
+        impressoes[c["rotulo"]] = {}
+        pendentes[c["rotulo"]] = runs.alvos_pendentes(
+            selected_targets, c["params"], c["outputs"], retomar, impressoes[c["rotulo"]]
+        )
+    total = sum(len(p) for p in pendentes.values())
+
+    # Um grid só tem uma configuração: o chunk é escolhido para o total de ajustes,
+    # limitado ao número de alvos
+    chunk_size = config.CHUNK_SIZE or scheduler.escolher_chunk_size(total, max_workers)
+    chunk_size = max(1, min(chunk_size, len(selected_targets)))
+
+    # Configurações com a mesma base e janela usam o mesmo recorte
+    base_dirs = {}
+    historico = scheduler.carregar_historico() if config.ORDENAR_JOBS else None
+    pixels = {}
+    jobs = []
+    for c in preparadas:
+        alvos = pendentes[c["rotulo"]]
+        if not alvos:
+            continue
+        s = c["params"]
+        chave = tuple(s[k] for k in CHAVES_RECORTE)
+        if chave not in base_dirs:
+            base_dirs[chave] = runs.preparar_base_dir(s)
+        custos = None
+        if historico is not None:
+            custos, pixels[c["rotulo"]] = scheduler.prever_custos(alvos, s, historico)
+        for job in runs.montar_jobs(
+            alvos,
+            s,
+            base_dirs[chave],
+            chunk_size,
+            c["grids"],
+            c["logs"],
+            c["outputs"],
+            custos=custos,
+        ):
+            jobs.append({**job, "config": c["rotulo"]})
+    # Um único pool para todas as configurações: os grids mais caros de qualquer uma vão primeiro
+    jobs.sort(key=lambda job: job["custo"], reverse=True)
+
+    print(
+        f"  > Varredura '{nome}': {len(preparadas)} configurações x {len(selected_targets)} alvos "
+        f"({total} ajustes a rodar)."
+    )
+    print(f"  > {len(jobs)} grids com até {chunk_size} ajustes cada, {max_workers} threads.\n")
+
+    def registrar(resultado):
+        for alvo in resultado["alvos"]:
+            if alvo not in resultado["faltando"]:
+                runs.salvar_impressao(
+                    resultado["out_dir"], alvo, impressoes[resultado["config"]][alvo]
+                )
+
+    metricas_file = os.path.join(sweep_dir, "metrics.jsonl")
+    if not retomar and os.path.exists(metricas_file):
+        os.remove(metricas_file)
+    resultados = scheduler.executar_jobs(
+        jobs, max_workers, ao_concluir=registrar, metricas=metricas_file
+    )
+
+    historico = scheduler.carregar_historico()
+    for c in preparadas:
+        da_config = [r for r in resultados if r["config"] == c["rotulo"]]
+        scheduler.atualizar_historico(
+            historico, c["params"], da_config, pixels.get(c["rotulo"])
+        )
+    scheduler.salvar_historico(historico)
+
+    for r in resultados:
+        if not r["ok"]:
+            print(
+                f"  [ERRO] {r['config']}/{os.path.basename(r['grid'])}: {r['erro']} "
+                f"(alvos sem saída: {', '.join(r['faltando']) or 'nenhum'})"
+            )
+
+    # Resumo rotulado por configuração
+    tabelas = []
+    for c in preparadas:
+        out_paths = [
+            os.path.join(c["outputs"], f"{a}.out")
+            for a in selected_targets
+            if os.path.exists(os.path.join(c["outputs"], f"{a}.out"))
+        ]
+        df = runs.colher_resultados(out_paths, max_workers)
+        df.insert(0, "Config", c["rotulo"])
+        for i, (chave, valor) in enumerate(c["variacao"].items()):
+            df.insert(1 + i, chave, valor)
+        tabelas.append(df)
+        if config.EXPORTAR_ACERVO:
+            import acervo
+
+            # A partição é substituída inteira: exporta todos os .out, não só os alvos desta execução
+            acervo.exportar(
+                glob.glob(os.path.join(c["outputs"], "*.out")),
+                f"sweep-{nome}",
+                c["rotulo"],
+                n_workers=max_workers,
+            )
+    df = pd.concat(tabelas, ignore_index=True)
+    df = runs.juntar_metricas(df, metricas_file)
+    runs.escrever_summary(df, sweep_dir, parquet=config.SUMMARY_PARQUET)
+
+    print(f"   Resumo da varredura: {os.path.join(sweep_dir, 'summary.csv')}")
+    return df
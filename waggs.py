@@ -1,13 +1,13 @@
 import glob
+import hashlib
+import json
 import os
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-import matplotlib.pyplot as plt
 import numpy as np
-from astropy.io import fits
-from astropy.wcs import WCS
-from scipy.interpolate import interp1d
-from scipy.ndimage import gaussian_filter1d
+
+import spec_io
 
 err_s = 0.0245
 fwhm_target = 2.51
@@ -15,7 +15,17 @@ lambda_min = 3200
 lambda_max = 9100
 step = 1.0
 R_dados = 6800
-plots = True
+plots = True  # True = todos os alvos, "sinalizados" = só alvos suspeitos, False = nenhum
+n_workers_plots = 2  # Processos dedicados à renderização dos gráficos
+limiar_sinalizacao = 0.25  # Fração de pixels com flag acima da qual o alvo é "sinalizado"
+sidecar_npy = False  # True = salva também {alvo}.in.npy para leitura rápida em Python
+lote = False  # True = motor vetorizado processar_lote
+forcar = False  # True = ignora o manifest e reprocessa todos os alvos
+# True = operadores esparsos em cache no motor em lote (mais rápido, mas só concorda com o
+# caminho por alvo até a precisão float32 dos FITS: os .in deixam de ser idênticos)
+usar_operadores = False
+resolucao_variavel = False  # True = kernel com FWHM dependente de lambda (λ/R_dados)
+n_workers = max(1, int((os.cpu_count() or 1) * (5 / 6)))  # 1 = modo serial
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = SCRIPT_DIR
@@ -23,31 +33,244 @@ WAGGS_DIR = os.path.join(PROJECT_ROOT, "Dados", "WAGGS-DR1")
 
 OUTPUT_IN_DIR = os.path.join(PROJECT_ROOT, "inputs_waggs")
 OUTPUT_PLOT_DIR = os.path.join(PROJECT_ROOT, "input_plots_waggs")
-
-os.makedirs(OUTPUT_IN_DIR, exist_ok=True)
-os.makedirs(OUTPUT_PLOT_DIR, exist_ok=True)
+MANIFEST_FILE = os.path.join(OUTPUT_IN_DIR, "manifest.json")
+OPERATOR_CACHE_DIR = os.path.join(PROJECT_ROOT, "cache_operadores")
 
 
 def get_data_from_fits(filepath):
     """
     Lê fluxo, header e erro do arquivo FITS e retorna lambda, fluxo, erro.
+    Headers lineares não passam pelo WCS completo (spec_io.lambdas_fits).
     """
-    with fits.open(filepath) as file:
-        flux = file[0].data
-        header = file[0].header
-        try:
-            error = file[1].data
-        except IndexError:
-            error = np.full_like(flux, np.nan)
-
-        wcs = WCS(header)
-        pixel_indices = np.arange(len(flux))
-        lambdas = wcs.pixel_to_world_values(pixel_indices)
-        lambdas = lambdas * 1e10
+    lambdas, flux, error = spec_io.ler_fits(filepath, com_erro=True)
+    lambdas = lambdas * 1e10
 
     return lambdas, flux, error
 
 
+# Cache em memória dos operadores já construídos nesta sessão: {chave: operador}
+_operadores = {}
+
+
+def _indices_reflect(j, n):
+    """
+    Converte índices fora de [0, n) para o modo 'reflect' do scipy.ndimage (d c b a | a b c d | d c b a).
+    """
+    m = np.mod(j, 2 * n)
+    return np.where(m < n, m, 2 * n - 1 - m)
+
+
+def _matriz_gaussiana(n_pix, sigma_pix, truncate=4.0):
+    """
+    Matriz esparsa (n_pix x n_pix) equivalente a gaussian_filter1d(mode="reflect").
+    sigma_pix pode ser escalar ou um array por pixel; pixels com sigma <= 0.5 não são alargados.
+    """
+    from scipy import sparse
+
+    sigma_pix = np.broadcast_to(np.asarray(sigma_pix, dtype=float), (n_pix,))
+    alargar = sigma_pix > 0.5
+    if not np.any(alargar):
+        return sparse.identity(n_pix, format="csr")
+
+    raios = np.where(alargar, (truncate * sigma_pix + 0.5).astype(int), 0)
+    r_max = int(raios.max())
+    k = np.arange(-r_max, r_max + 1)
+
+    sigma_seguro = np.where(alargar, sigma_pix, 1.0)[:, None]
+    pesos = np.exp(-0.5 * (k[None, :] / sigma_seguro) ** 2)
+    pesos[np.abs(k)[None, :] > raios[:, None]] = 0.0
+    pesos /= pesos.sum(axis=1, keepdims=True)
+
+    linhas = np.repeat(np.arange(n_pix), len(k))
+    colunas = _indices_reflect(np.arange(n_pix)[:, None] + k[None, :], n_pix).ravel()
+    pesos = pesos.ravel()
+    usados = pesos != 0
+    # Entradas duplicadas (bordas refletidas) são somadas na conversão para CSR
+    return sparse.coo_matrix(
+        (pesos[usados], (linhas[usados], colunas[usados])), shape=(n_pix, n_pix)
+    ).tocsr()
+
+
+def _matriz_interpolacao(l_orig, master_lambda):
+    """
+    Matriz esparsa (n_master x n_pix) de interpolação linear, seu suporte e a máscara dos pontos fora do intervalo.
+    """
+    from scipy import sparse
+
+    ordem = np.argsort(l_orig, kind="mergesort")
+    x = l_orig[ordem]
+    idx = np.searchsorted(x, master_lambda).clip(1, len(x) - 1)
+    lo = idx - 1
+    w = (master_lambda - x[lo]) / (x[idx] - x[lo])
+    fora = (master_lambda < x[0]) | (master_lambda > x[-1])
+
+    linhas = np.repeat(np.arange(len(master_lambda)), 2)
+    colunas = np.column_stack((ordem[lo], ordem[idx])).ravel()
+    pesos = np.column_stack((1 - w, w)).ravel()
+    shape = (len(master_lambda), len(l_orig))
+    matriz = sparse.csr_matrix((pesos, (linhas, colunas)), shape=shape)
+    # Suporte estrutural (inclui vizinhos de peso 0): interp1d propaga NaN deles também
+    suporte = sparse.csr_matrix((np.ones_like(pesos), (linhas, colunas)), shape=shape)
+    return matriz, suporte, fora
+
+
+def _salvar_operador(path, operador):
+    arrays = {"fora": operador["fora"]}
+    for nome in ("A", "G", "I", "P"):
+        m = operador[nome]
+        arrays[f"{nome}_data"] = m.data
+        arrays[f"{nome}_indices"] = m.indices
+        arrays[f"{nome}_indptr"] = m.indptr
+        arrays[f"{nome}_shape"] = np.array(m.shape)
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def _carregar_operador(path):
+    from scipy import sparse
+
+    with np.load(path) as arrays:
+        operador = {"fora": arrays["fora"]}
+        for nome in ("A", "G", "I", "P"):
+            operador[nome] = sparse.csr_matrix(
+                (
+                    arrays[f"{nome}_data"],
+                    arrays[f"{nome}_indices"],
+                    arrays[f"{nome}_indptr"],
+                ),
+                shape=tuple(arrays[f"{nome}_shape"]),
+            )
+    return operador
+
+
+def obter_operador(
+    l_orig,
+    master_lambda,
+    fwhm_target,
+    R_dados,
+    resolucao_variavel=False,
+    cache_dir=OPERATOR_CACHE_DIR,
+):
+    """
+    Retorna o operador linear (alargamento + reamostragem) de uma geometria de banda.
+    Depende só do eixo de lambda da banda, de R_dados, fwhm_target e do grid mestre, nunca
+    do fluxo; por isso é construído uma vez e guardado em memória e em disco (cache_dir).
+
+    Args:
+        l_orig [array]: Eixo de lambda da banda
+        master_lambda [array]: Grid comum de saída
+        fwhm_target [float]: FWHM alvo em Angstroms
+        R_dados [float]: Resolução espectral dos dados de entrada
+        resolucao_variavel [bool]: Se True, o kernel usa FWHM_dados = λ/R_dados em cada pixel
+            em vez do valor no lambda central
+        cache_dir [str]: Diretório do cache em disco (None = apenas memória)
+
+    Returns:
+        dict: {'A': I@G (fluxo), 'G': alargamento, 'I': interpolação,
+               'P': suporte de A (propagação de NaN), 'fora': máscara sem dados}
+    """
+    # O grid inteiro entra na chave: grids com o mesmo tamanho e extremos mas amostragem
+    # interna diferente precisam de operadores diferentes
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(l_orig, dtype=float).tobytes())
+    h.update(np.ascontiguousarray(master_lambda, dtype=float).tobytes())
+    h.update(repr((float(fwhm_target), float(R_dados), bool(resolucao_variavel))).encode())
+    chave = h.hexdigest()
+    if chave in _operadores:
+        return _operadores[chave]
+
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, f"op_{chave[:24]}.npz")
+        if os.path.exists(path):
+            _operadores[chave] = _carregar_operador(path)
+            return _operadores[chave]
+
+    delta_l = np.nanmedian(np.diff(l_orig))
+    if resolucao_variavel:
+        fwhm_dados = l_orig / R_dados
+    else:
+        fwhm_dados = np.nanmedian(l_orig) / R_dados
+    fwhm_kernel_sq = np.maximum(fwhm_target**2 - fwhm_dados**2, 0.0)
+    sigma_pix = np.sqrt(fwhm_kernel_sq) / 2.355 / delta_l
+
+    G = _matriz_gaussiana(len(l_orig), sigma_pix)
+    I, suporte, fora = _matriz_interpolacao(l_orig, master_lambda)
+    G_suporte = G.copy()
+    G_suporte.data[:] = 1.0
+    operador = {
+        "A": (I @ G).tocsr(),
+        "G": G,
+        "I": I,
+        "P": (suporte @ G_suporte).tocsr(),
+        "fora": fora,
+    }
+
+    if path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        _salvar_operador(path, operador)
+    _operadores[chave] = operador
+    return operador
+
+
+def aplicar_operador(operador, F, E):
+    """
+    Aplica o operador de uma banda a um espectro (1-D) ou a um lote de espectros (2-D, um por linha).
+    Fluxo: um produto esparso com A. Erro: variância alargada com G e depois interpolada com I,
+    como em processar_espectros.
+
+    Returns:
+        tuple: (fluxo reamostrado, erro reamostrado) no grid mestre
+    """
+    F = np.asarray(F, dtype=float)
+    E = np.asarray(E, dtype=float)
+    f_res = (operador["A"] @ F.T).T
+    e_res = (operador["I"] @ np.sqrt(operador["G"] @ (E**2).T)).T
+
+    # NaN nos dados contaminam toda a janela do kernel, como no gaussian_filter1d + interp1d
+    for entrada, saida in ((F, f_res), (E, e_res)):
+        nans = np.isnan(entrada)
+        if np.any(nans):
+            saida[(operador["P"] @ nans.T.astype(float)).T > 0] = np.nan
+
+    f_res[..., operador["fora"]] = np.nan
+    e_res[..., operador["fora"]] = np.nan
+    return f_res, e_res
+
+
+def aplicar_flags(master_flux, master_error, err_sistematico):
+    """
+    Marca pixels ruins (flag=2, fluxo 0, erro 1e19) e soma o erro sistemático em quadratura.
+    Opera elemento a elemento, então aceita tanto um espectro (1-D) quanto um lote (2-D).
+
+    Returns:
+        tuple: (fluxo, erro, flag)
+    """
+    # Flags
+    flag = np.zeros_like(master_flux)
+    bad_pixels = (
+        np.isnan(master_flux)
+        | (master_flux <= 0)
+        | np.isnan(master_error)
+        | (master_error <= 0)
+    )
+
+    flag[bad_pixels] = 2
+    master_flux[bad_pixels] = 0.0
+    master_error[bad_pixels] = 1e19
+    master_error = np.nan_to_num(master_error, nan=1e19)
+
+    # Erro sistemático
+    good_pixels = ~bad_pixels
+    master_error[good_pixels] = np.sqrt(
+        master_error[good_pixels] ** 2
+        + (err_sistematico * master_flux[good_pixels]) ** 2
+    )
+
+    return master_flux, master_error, flag
+
+
 def processar_espectros(
     files_dict,
     lambda_min,
@@ -72,6 +295,8 @@ def processar_espectros(
         err_sistematico [float]: Fração de erro sistemático adicionado em quadratura
         R_dados [float]: Resolução espectral (R = λ/Δλ) dos dados de entrada (WAGGS: 6800)
     """
+    from scipy.interpolate import interp1d
+    from scipy.ndimage import gaussian_filter1d
 
     master_lambda = np.arange(lambda_min, lambda_max + 1, step)
     master_flux = np.full_like(master_lambda, np.nan)
@@ -132,57 +357,349 @@ def processar_espectros(
         master_flux[mask_update] = f_resampled[mask_update]
         master_error[mask_update] = e_resampled[mask_update]
 
-    # Flags
-    flag = np.zeros_like(master_flux)
-    bad_pixels = (
-        np.isnan(master_flux)
-        | (master_flux <= 0)
-        | np.isnan(master_error)
-        | (master_error <= 0)
+    master_flux, master_error, flag = aplicar_flags(
+        master_flux, master_error, err_sistematico
     )
 
-    flag[bad_pixels] = 2
-    master_flux[bad_pixels] = 0.0
-    master_error[bad_pixels] = 1e19
-    master_error = np.nan_to_num(master_error, nan=1e19)
-
-    # Erro sistemático
-    good_pixels = ~bad_pixels
-    master_error[good_pixels] = np.sqrt(
-        master_error[good_pixels] ** 2
-        + (err_sistematico * master_flux[good_pixels]) ** 2
+    spec_io.escrever_in(
+        output_name, master_lambda, master_flux, master_error, flag, sidecar=sidecar_npy
     )
 
-    output_data = np.column_stack((master_lambda, master_flux, master_error, flag))
+    return master_lambda, master_flux, master_error
 
-    np.savetxt(output_name, output_data, fmt=["%.1f", "%.16e", "%.16e", "%d"])
 
-    return master_lambda, master_flux, master_error
+def _interpolar_lote(l_orig, Y, master_lambda):
+    """
+    Interpolação linear de várias linhas de Y (mesmo eixo l_orig) para master_lambda.
+    Reproduz a aritmética de interp1d(kind="linear", bounds_error=False, fill_value=nan),
+    mas calcula os índices e pesos uma única vez para o lote inteiro.
+    """
+    ordem = np.argsort(l_orig, kind="mergesort")
+    x = l_orig[ordem]
+    Y = Y[:, ordem]
 
+    idx = np.searchsorted(x, master_lambda).clip(1, len(x) - 1)
+    lo = idx - 1
+    x_lo = x[lo]
+    x_hi = x[idx]
+    y_lo = Y[:, lo]
+    y_hi = Y[:, idx]
 
-print(f"Procurando arquivos em: {os.path.abspath(WAGGS_DIR)}")
-all_files = glob.glob(os.path.join(WAGGS_DIR, "norm_*.fits"))
-print(f"Encontrados {len(all_files)} arquivos FITS brutos.")
+    slope = (y_hi - y_lo) / (x_hi - x_lo)
+    resultado = slope * (master_lambda - x_lo) + y_lo
 
-targets = {}
-for file_path in all_files:
-    filename = os.path.basename(file_path)
-    parts = filename.split("_")
-    target_name = parts[1]
-    band = parts[2][0]
-    if target_name not in targets:
-        targets[target_name] = {}
-        print(f"  Alvo: {target_name}")
-    targets[target_name][band] = file_path
+    fora = (master_lambda < x[0]) | (master_lambda > x[-1])
+    resultado[:, fora] = np.nan
+    return resultado
 
-with warnings.catch_warnings():
-    warnings.simplefilter("ignore")
-    for target_name, bands_dict in targets.items():
-        output_file = os.path.join(OUTPUT_IN_DIR, f"{target_name}.in")
-        plot_file = os.path.join(OUTPUT_PLOT_DIR, f"{target_name}_processed.png")
 
+def processar_lote(
+    targets,
+    lambda_min,
+    lambda_max,
+    step,
+    output_dir,
+    fwhm_target,
+    err_sistematico,
+    R_dados,
+    tamanho_lote=256,
+    operadores=False,
+    resolucao_variavel=False,
+):
+    """
+    Versão vetorizada de processar_espectros para vários alvos de uma vez.
+    As bandas que compartilham o mesmo grid de pixels (mesma geometria) são empilhadas
+    em arrays 2-D; alargamento, interpolação, escala de overlap e combinação são feitos
+    com poucas chamadas NumPy por grupo em vez de uma série por banda e alvo.
+    Os arquivos .in gerados são iguais aos do caminho por alvo.
+
+    Args:
+        targets [dict]: {'Alvo': {'Banda': 'caminho/arquivo.fits'}}
+        lambda_min [float]: Lambda inicial
+        lambda_max [float]: Lambda final
+        step [float]: Passo do grid
+        output_dir [str]: Diretório onde os arquivos {alvo}.in são escritos
+        fwhm_target [float]: FWHM alvo em Angstroms (ex: BC03=3.0, MILES=2.51)
+        err_sistematico [float]: Fração de erro sistemático adicionado em quadratura
+        R_dados [float]: Resolução espectral (R = λ/Δλ) dos dados de entrada (WAGGS: 6800)
+        tamanho_lote [int]: Número máximo de alvos mantidos em memória ao mesmo tempo
+        operadores [bool]: Usa os operadores esparsos em cache (obter_operador) em vez de
+            filtrar e interpolar cada grupo (calcula em float64; concorda
+            com o caminho por alvo até a precisão float32 dos FITS)
+        resolucao_variavel [bool]: Com operadores=True, usa FWHM dependente de lambda
+
+    Returns:
+        tuple: (master_lambda, {'Alvo': (fluxo, erro)}, {'Alvo': mensagem de erro})
+    """
+    from scipy.ndimage import gaussian_filter1d
+
+    master_lambda = np.arange(lambda_min, lambda_max + 1, step)
+    resultados = {}
+    falhas = {}
+
+    nomes_todos = list(targets.keys())
+    for inicio in range(0, len(nomes_todos), tamanho_lote):
+        nomes = nomes_todos[inicio : inicio + tamanho_lote]
+        n_alvos = len(nomes)
+
+        master_flux = np.full((n_alvos, len(master_lambda)), np.nan)
+        master_error = np.full((n_alvos, len(master_lambda)), np.nan)
+        validos = np.ones(n_alvos, dtype=bool)
+
+        # A k-ésima banda de cada alvo é combinada na mesma ordem do caminho por alvo
+        bandas = [list(targets[nome].values()) for nome in nomes]
+        n_passos = max((len(b) for b in bandas), default=0)
+
+        for k in range(n_passos):
+            # Agrupa por geometria (grid de lambda + dtype) para empilhar em 2-D
+            grupos = {}
+            for i, paths in enumerate(bandas):
+                if k >= len(paths) or not validos[i]:
+                    continue
+                path = paths[k]
+                try:
+                    l_orig, f_orig, e_orig = get_data_from_fits(path)
+                except FileNotFoundError:
+                    print(f"    [ERRO] Arquivo não encontrado: {path}")
+                    continue
+                except Exception as e:
+                    falhas[nomes[i]] = str(e)
+                    validos[i] = False
+                    continue
+
+                # Grid completo (não só tamanho e extremos): o lote compartilha um único l
+                chave = (l_orig.dtype.str, l_orig.tobytes(), f_orig.dtype, e_orig.dtype)
+                grupo = grupos.setdefault(chave, {"l": l_orig, "i": [], "f": [], "e": []})
+                grupo["i"].append(i)
+                grupo["f"].append(f_orig)
+                grupo["e"].append(e_orig)
+
+            for grupo in grupos.values():
+                l_orig = grupo["l"]
+                idx = np.array(grupo["i"])
+                F = np.vstack(grupo["f"])
+                E = np.vstack(grupo["e"])
+
+                if operadores:
+                    op = obter_operador(
+                        l_orig, master_lambda, fwhm_target, R_dados, resolucao_variavel
+                    )
+                    f_resampled, e_resampled = aplicar_operador(op, F, E)
+                else:
+                    l_central = np.nanmedian(l_orig)
+                    fwhm_dados = l_central / R_dados
+                    fwhm_kernel_sq = fwhm_target**2 - fwhm_dados**2
+
+                    delta_l = np.nanmedian(np.diff(l_orig))
+
+                    if fwhm_kernel_sq > 0:
+                        sigma_angstroms = np.sqrt(fwhm_kernel_sq) / 2.355
+                        sigma_pix = sigma_angstroms / delta_l
+
+                        if sigma_pix > 0.5:
+                            F = gaussian_filter1d(F, sigma_pix, axis=-1)
+                            E = np.sqrt(gaussian_filter1d(E**2, sigma_pix, axis=-1))
+
+                    f_resampled = _interpolar_lote(l_orig, F, master_lambda)
+                    e_resampled = _interpolar_lote(l_orig, E, master_lambda)
+
+                mf = master_flux[idx]
+                me = master_error[idx]
+
+                # Overlap e shift (uma mediana por alvo)
+                has_new_data = ~np.isnan(f_resampled)
+                is_master_empty = np.isnan(mf)
+                mask_overlap = has_new_data & (~is_master_empty)
+
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    ratios = np.where(mask_overlap, mf / f_resampled, np.nan)
+                    ratio = np.nanmedian(ratios, axis=1)
+
+                escala = np.any(mask_overlap, axis=1) & ~np.isnan(ratio) & (ratio > 0)
+                f_resampled[escala] *= ratio[escala, None]
+                e_resampled[escala] *= ratio[escala, None]
+
+                mask_fill = has_new_data & is_master_empty
+                mf[mask_fill] = f_resampled[mask_fill]
+                me[mask_fill] = e_resampled[mask_fill]
+
+                safe_master_err = np.nan_to_num(me, nan=999999)
+                safe_new_err = np.nan_to_num(e_resampled, nan=999999)
+
+                better_error = safe_new_err < safe_master_err
+                mask_update = mask_overlap & better_error
+
+                mf[mask_update] = f_resampled[mask_update]
+                me[mask_update] = e_resampled[mask_update]
+
+                master_flux[idx] = mf
+                master_error[idx] = me
+
+        master_flux, master_error, flag = aplicar_flags(
+            master_flux, master_error, err_sistematico
+        )
+
+        for i, nome in enumerate(nomes):
+            if not validos[i]:
+                continue
+            output_name = os.path.join(output_dir, f"{nome}.in")
+            spec_io.escrever_in(
+                output_name,
+                master_lambda,
+                master_flux[i],
+                master_error[i],
+                flag[i],
+                sidecar=sidecar_npy,
+            )
+            resultados[nome] = (master_flux[i], master_error[i])
+
+    return master_lambda, resultados, falhas
+
+
+def descobrir_alvos(waggs_dir, verboso=True):
+    """
+    Agrupa os arquivos norm_*.fits do WAGGS por alvo e banda.
+
+    Returns:
+        dict: {'Alvo': {'Banda': 'caminho/arquivo.fits'}}
+    """
+    all_files = glob.glob(os.path.join(waggs_dir, "norm_*.fits"))
+    if verboso:
+        print(f"Procurando arquivos em: {os.path.abspath(waggs_dir)}")
+        print(f"Encontrados {len(all_files)} arquivos FITS brutos.")
+
+    targets = {}
+    for file_path in all_files:
+        filename = os.path.basename(file_path)
+        parts = filename.split("_")
+        target_name = parts[1]
+        band = parts[2][0]
+        if target_name not in targets:
+            targets[target_name] = {}
+            if verboso:
+                print(f"  Alvo: {target_name}")
+        targets[target_name][band] = file_path
+    return targets
+
+
+def _decimar(l_ambda, fluxo, erro, n_baldes):
+    """
+    Reduz os arrays à resolução da tela: para cada coluna de pixels guarda o mínimo e o
+    máximo do fluxo (linha) e o envelope fluxo ± erro dos pixels válidos (banda de erro).
+    """
+    if len(l_ambda) <= 2 * n_baldes:
+        mask_valid = erro < 70
+        lo = np.where(mask_valid, fluxo - erro, np.nan)
+        hi = np.where(mask_valid, fluxo + erro, np.nan)
+        return l_ambda, fluxo, l_ambda, lo, hi
+
+    bordas = np.linspace(0, len(l_ambda), n_baldes + 1).astype(int)[:-1]
+    centros = np.add.reduceat(l_ambda, bordas) / np.diff(np.append(bordas, len(l_ambda)))
+
+    f_min = np.minimum.reduceat(fluxo, bordas)
+    f_max = np.maximum.reduceat(fluxo, bordas)
+    l_linha = np.repeat(centros, 2)
+    f_linha = np.column_stack((f_min, f_max)).ravel()
+
+    mask_valid = erro < 70
+    lo = np.minimum.reduceat(np.where(mask_valid, fluxo - erro, np.inf), bordas)
+    hi = np.maximum.reduceat(np.where(mask_valid, fluxo + erro, -np.inf), bordas)
+    sem_dados = ~np.isfinite(lo)
+    lo[sem_dados] = np.nan
+    hi[sem_dados] = np.nan
+    return l_linha, f_linha, centros, lo, hi
+
+
+def plotar_espectro(l_ambda, fluxo, erro, target_name, plot_file, figsize=(12, 5), dpi=150):
+    """
+    Salva o gráfico de diagnóstico (fluxo e banda de erro) de um alvo processado.
+    Usa o backend não interativo Agg e decima os dados para a largura da figura em pixels.
+    """
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    l_linha, f_linha, l_banda, lo, hi = _decimar(
+        l_ambda, fluxo, erro, n_baldes=int(figsize[0] * dpi)
+    )
+
+    plt.figure(figsize=figsize)
+    plt.plot(l_linha, f_linha, color="black", lw=0.5, label="Fluxo")
+    plt.fill_between(
+        l_banda,
+        lo,
+        hi,
+        color="gray",
+        alpha=0.3,
+        label="Erro",
+    )
+    plt.title(f"Dados WAGGS: {target_name}")
+    plt.xlabel(r"Comprimento de Onda $[\AA]$")
+    plt.ylabel("Fluxo Normalizado")
+    plt.xlim(lambda_min, lambda_max)
+    plt.legend()
+    plt.grid(True, alpha=0.3)
+    plt.tight_layout()
+    plt.savefig(plot_file, dpi=dpi)
+    plt.close()
+
+
+def renderizar_plot(target_name, modo=True):
+    """
+    Gera o gráfico de um alvo a partir do seu arquivo .in (não depende do processamento em memória).
+    Com modo="sinalizados", só desenha se a fração de pixels com flag passar de limiar_sinalizacao.
+
+    Returns:
+        tuple: (target_name, mensagem de erro ou None)
+    """
+    output_file = os.path.join(OUTPUT_IN_DIR, f"{target_name}.in")
+    plot_file = os.path.join(OUTPUT_PLOT_DIR, f"{target_name}_processed.png")
+    try:
+        dados = spec_io.ler_tabela(output_file)
+        l_ambda, fluxo, erro, flag = dados[:, 0], dados[:, 1], dados[:, 2], dados[:, 3]
+        if modo == "sinalizados" and np.mean(flag > 0) <= limiar_sinalizacao:
+            return target_name, None
+        plotar_espectro(l_ambda, fluxo, erro, target_name, plot_file)
+    except Exception as e:
+        return target_name, str(e)
+    return target_name, None
+
+
+def renderizar_plots(target_names, modo=True, n_workers=n_workers_plots):
+    """
+    Renderiza sob demanda os gráficos de alvos já processados, num pool próprio.
+
+    Returns:
+        dict: {'Alvo': mensagem de erro} apenas para os gráficos que falharam
+    """
+    os.makedirs(OUTPUT_PLOT_DIR, exist_ok=True)
+    falhas = {}
+    with ProcessPoolExecutor(max_workers=max(1, n_workers)) as executor:
+        futures = [executor.submit(renderizar_plot, nome, modo) for nome in target_names]
+        for future in as_completed(futures):
+            target_name, erro = future.result()
+            if erro is not None:
+                print(f"  [ERRO] Gráfico: {target_name}: {erro}")
+                falhas[target_name] = erro
+    return falhas
+
+
+def processar_alvo(target_name, bands_dict):
+    """
+    Processa um alvo (arquivo .in).
+    Roda tanto no processo principal quanto nos workers do pool: as exceções são
+    capturadas aqui e devolvidas ao processo pai como mensagem.
+
+    Returns:
+        tuple: (target_name, mensagem de erro ou None)
+    """
+    output_file = os.path.join(OUTPUT_IN_DIR, f"{target_name}.in")
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
         try:
-            l_ambda, fluxo, erro = processar_espectros(
+            processar_espectros(
                 bands_dict,
                 lambda_min=lambda_min,
                 lambda_max=lambda_max,
@@ -192,27 +709,246 @@ with warnings.catch_warnings():
                 fwhm_target=fwhm_target,
                 R_dados=R_dados,
             )
-
-            mask_valid = erro < 70
-            if plots:
-                plt.figure(figsize=(12, 5))
-                plt.plot(l_ambda, fluxo, color="black", lw=0.5, label="Fluxo")
-                plt.fill_between(
-                    l_ambda[mask_valid],
-                    (fluxo - erro)[mask_valid],
-                    (fluxo + erro)[mask_valid],
-                    color="gray",
-                    alpha=0.3,
-                    label="Erro",
-                )
-                plt.title(f"Dados WAGGS: {target_name}")
-                plt.xlabel(r"Comprimento de Onda $[\AA]$")
-                plt.ylabel("Fluxo Normalizado")
-                plt.xlim(lambda_min, lambda_max)
-                plt.legend()
-                plt.grid(True, alpha=0.3)
-                plt.tight_layout()
-                plt.savefig(plot_file, dpi=150)
-                plt.close()
         except Exception as e:
-            print(f"  [ERRO] Falha: {target_name}: {e}")
+            return target_name, str(e)
+
+    return target_name, None
+
+
+def processar_todos(targets, n_workers=n_workers, ao_concluir=None):
+    """
+    Processa todos os alvos, em série (n_workers <= 1) ou num pool de processos.
+    Cada alvo é independente; erros são reportados por alvo.
+
+    Args:
+        targets [dict]: {'Alvo': {'Banda': 'caminho/arquivo.fits'}}
+        n_workers [int]: Número de processos simultâneos
+        ao_concluir [callable]: Chamado com o nome de cada alvo assim que seu .in existe
+
+    Returns:
+        dict: {'Alvo': mensagem de erro} apenas para os alvos que falharam
+    """
+    falhas = {}
+
+    if n_workers is None or n_workers <= 1 or len(targets) <= 1:
+        for target_name, bands_dict in targets.items():
+            _, erro = processar_alvo(target_name, bands_dict)
+            if erro is not None:
+                print(f"  [ERRO] Falha: {target_name}: {erro}")
+                falhas[target_name] = erro
+            elif ao_concluir is not None:
+                ao_concluir(target_name)
+        return falhas
+
+    n_workers = min(n_workers, len(targets))
+    print(f"  > Processando {len(targets)} alvos com {n_workers} processos.")
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {
+            executor.submit(processar_alvo, target_name, bands_dict): target_name
+            for target_name, bands_dict in targets.items()
+        }
+        for future in as_completed(futures):
+            target_name = futures[future]
+            try:
+                _, erro = future.result()
+            except Exception as e:
+                # Falha do próprio worker (ex.: processo morto)
+                erro = str(e)
+            if erro is not None:
+                print(f"  [ERRO] Falha: {target_name}: {erro}")
+                falhas[target_name] = erro
+            elif ao_concluir is not None:
+                ao_concluir(target_name)
+
+    return falhas
+
+
+def processar_todos_lote(targets, ao_concluir=None):
+    """
+    Processa todos os alvos com o motor vetorizado (processar_lote).
+
+    Returns:
+        dict: {'Alvo': mensagem de erro} apenas para os alvos que falharam
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        l_ambda, resultados, falhas = processar_lote(
+            targets,
+            lambda_min=lambda_min,
+            lambda_max=lambda_max,
+            step=step,
+            output_dir=OUTPUT_IN_DIR,
+            err_sistematico=err_s,
+            fwhm_target=fwhm_target,
+            R_dados=R_dados,
+            operadores=usar_operadores,
+            resolucao_variavel=resolucao_variavel,
+        )
+
+    for target_name, erro in falhas.items():
+        print(f"  [ERRO] Falha: {target_name}: {erro}")
+
+    if ao_concluir is not None:
+        for target_name in resultados:
+            ao_concluir(target_name)
+
+    return falhas
+
+
+def parametros_processamento():
+    """
+    Parâmetros do módulo que alteram o conteúdo dos arquivos .in (entram no hash do manifest).
+    """
+    return {
+        "err_s": err_s,
+        "fwhm_target": fwhm_target,
+        "lambda_min": lambda_min,
+        "lambda_max": lambda_max,
+        "step": step,
+        "R_dados": R_dados,
+        "operadores": bool(lote and usar_operadores),
+        "resolucao_variavel": bool(lote and usar_operadores and resolucao_variavel),
+    }
+
+
+def carregar_manifest(path=MANIFEST_FILE):
+    """
+    Lê o manifest de pré-processamento (ou retorna um vazio).
+    Formato: {'arquivos': {caminho: {tamanho, mtime, sha256}}, 'alvos': {alvo: {hash, plot}}}
+    """
+    if os.path.exists(path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            print(f"  [AVISO] Manifest ilegível, reprocessando tudo: {path}")
+    return {"arquivos": {}, "alvos": {}}
+
+
+def salvar_manifest(manifest, path=MANIFEST_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _hash_arquivo(path, manifest):
+    """
+    sha256 do conteúdo de um arquivo. O resultado fica no manifest junto com tamanho e mtime,
+    então arquivos que não mudaram não são relidos.
+    """
+    st = os.stat(path)
+    registro = manifest["arquivos"].get(path)
+    if (
+        registro is not None
+        and registro["tamanho"] == st.st_size
+        and registro["mtime"] == st.st_mtime_ns
+    ):
+        return registro["sha256"]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    manifest["arquivos"][path] = {
+        "tamanho": st.st_size,
+        "mtime": st.st_mtime_ns,
+        "sha256": h.hexdigest(),
+    }
+    return h.hexdigest()
+
+
+def hash_alvo(bands_dict, manifest, parametros):
+    """
+    Hash de um alvo: conteúdo de cada banda (na ordem de combinação) + parâmetros de processamento.
+    """
+    h = hashlib.sha256(json.dumps(parametros, sort_keys=True).encode())
+    for band, path in bands_dict.items():
+        h.update(band.encode())
+        h.update(_hash_arquivo(path, manifest).encode())
+    return h.hexdigest()
+
+
+def filtrar_alterados(targets, manifest, parametros):
+    """
+    Separa os alvos novos ou alterados (entradas, parâmetros ou .in ausente).
+
+    Returns:
+        tuple: (alvos a processar, {alvo: hash} de todos os alvos)
+    """
+    pendentes = {}
+    hashes = {}
+    for target_name, bands_dict in targets.items():
+        try:
+            hashes[target_name] = hash_alvo(bands_dict, manifest, parametros)
+        except OSError:
+            # Arquivo sumiu entre o glob e o hash: processar_espectros reporta o erro
+            pendentes[target_name] = bands_dict
+            continue
+
+        registro = manifest["alvos"].get(target_name)
+        output_file = os.path.join(OUTPUT_IN_DIR, f"{target_name}.in")
+        atualizado = (
+            registro is not None
+            and registro["hash"] == hashes[target_name]
+            and os.path.exists(output_file)
+        )
+        if not atualizado:
+            pendentes[target_name] = bands_dict
+    return pendentes, hashes
+
+
+def main():
+    os.makedirs(OUTPUT_IN_DIR, exist_ok=True)
+    os.makedirs(OUTPUT_PLOT_DIR, exist_ok=True)
+
+    targets = descobrir_alvos(WAGGS_DIR)
+
+    manifest = {"arquivos": {}, "alvos": {}} if forcar else carregar_manifest()
+    parametros = parametros_processamento()
+    pendentes, hashes = filtrar_alterados(targets, manifest, parametros)
+    print(
+        f"  > {len(pendentes)} alvos novos ou alterados, "
+        f"{len(targets) - len(pendentes)} já atualizados."
+    )
+
+    # Gráficos numa fila própria: cada alvo entra assim que seu .in é escrito
+    plot_pool = ProcessPoolExecutor(max_workers=max(1, n_workers_plots)) if plots else None
+    futures_plots = []
+
+    def enfileirar_plot(target_name):
+        futures_plots.append(plot_pool.submit(renderizar_plot, target_name, plots))
+
+    ao_concluir = enfileirar_plot if plots else None
+    if plots:
+        # Alvos já atualizados que ainda não têm gráfico
+        for target_name in targets:
+            plot_file = os.path.join(OUTPUT_PLOT_DIR, f"{target_name}_processed.png")
+            if target_name not in pendentes and not os.path.exists(plot_file):
+                enfileirar_plot(target_name)
+
+    if lote:
+        falhas = processar_todos_lote(pendentes, ao_concluir=ao_concluir)
+    else:
+        falhas = processar_todos(pendentes, n_workers=n_workers, ao_concluir=ao_concluir)
+
+    for target_name in pendentes:
+        if target_name in falhas or target_name not in hashes:
+            manifest["alvos"].pop(target_name, None)
+        else:
+            manifest["alvos"][target_name] = {"hash": hashes[target_name]}
+    salvar_manifest(manifest)
+    print(f"  [OK] Arquivos .in prontos em: {OUTPUT_IN_DIR}")
+
+    if plot_pool is not None:
+        print(f"  > Aguardando {len(futures_plots)} gráficos.")
+        for future in as_completed(futures_plots):
+            target_name, erro = future.result()
+            if erro is not None:
+                print(f"  [ERRO] Gráfico: {target_name}: {erro}")
+        plot_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()